@@ -8,12 +8,18 @@
 
 import random
 import copy
+import math
 
 
 class Board:
 
-    def __init__(self, file_name="words.txt", board_size=5, num_first_player_words=9, num_second_player_words=8, num_assassins=1):
-        """ This method is called when an instance of Board is created. """
+    def __init__(self, file_name="words.txt", board_size=5, num_first_player_words=9, num_second_player_words=8, num_assassins=1, seed=None):
+        """ This method is called when an instance of Board is created.  Boards made with the same seed are the same,
+        which lets a logged game be dealt again. """
+        # All of the randomness below comes from this generator rather than the global random module.
+        self.seed = seed
+        self.random = random.Random(seed)
+
         # First initialize our basic class variables from provided parameters. If a class variable is
         # appended with 'initially', then that class variable corresponds to the initial state of the
         # board which does not change over time.  If the class variable is appended with 'currently',
@@ -49,7 +55,7 @@ class Board:
         for row_index in range(0, board_size):
             row = []
             for column_index in range(0, board_size):
-                elem_index = random.randint(0, len(word_list) - 1)
+                elem_index = self.random.randint(0, len(word_list) - 1)
                 elem = word_list.pop(elem_index)
                 row.append(elem)
             board.append(row)
@@ -62,22 +68,22 @@ class Board:
         available_words = [word for sublist in board for word in sublist]
 
         # First, sample the first player's words.
-        first_player_words = random.sample(available_words, num_first_player_words)
+        first_player_words = self.random.sample(available_words, num_first_player_words)
         available_words = [word for word in available_words if word not in first_player_words]
 
         # Second, sample the second player's words.
-        second_player_words = random.sample(available_words, num_second_player_words)
+        second_player_words = self.random.sample(available_words, num_second_player_words)
         available_words = [word for word in available_words if word not in second_player_words]
 
         # Third, sample the assassin(s).
-        assassin_words = random.sample(available_words, num_assassins)
+        assassin_words = self.random.sample(available_words, num_assassins)
         available_words = [word for word in available_words if word not in assassin_words]
 
         # The rest of the words are all civilians.
         civilian_words = available_words
 
         # Now that we have the four different lists, we can select a first player: red or blue.
-        if random.randint(0, 1) == 0:
+        if self.random.randint(0, 1) == 0:
             first_player = "red"
             red_words = first_player_words
             blue_words = second_player_words
@@ -93,13 +99,57 @@ class Board:
         # STEP 4: Finish initializing class variables.
         # -------------------------------------------------------------------------------------------
 
+        self.set_state(board, designations, first_player)
+
+        # The full description of a board is complete, so we are done.
+        return
+
+    @classmethod
+    def from_state(cls, board, designations, current_turn):
+        """ This method creates a Board from a board state that already exists, such as one read in by OCR or one
+        recorded in a log, instead of dealing a random one.  The board can be a flat list of words or a list of rows,
+        and the designations are the words that are still left for each of red, blue, assassin and civilian.  If the
+        board is None, it is made up from the designations. """
+        board_specs = cls.__new__(cls)
+        board_specs.seed = None
+        board_specs.random = random.Random()
+
+        designations = {key: list(designations.get(key, [])) for key in ['red', 'blue', 'assassin', 'civilian']}
+        if board is None:
+            # Only the designations are known, so the board is just the live words in designation order.
+            board = [word for key in ['red', 'blue', 'assassin', 'civilian'] for word in designations[key]]
+        if board and not isinstance(board[0], list):
+            row_length = int(math.ceil(len(board) ** 0.5))
+            board = [list(board[start:start + row_length]) for start in range(0, len(board), row_length)]
+        board_specs.board_size = len(board)
+        board_specs.set_state(board, designations, current_turn)
+
+        # We do not know who went first, so we treat the team whose turn it is as the first player.
+        if current_turn == 'red':
+            board_specs.num_first_player_words_initially = len(designations['red'])
+            board_specs.num_second_player_words_initially = len(designations['blue'])
+        else:
+            board_specs.num_first_player_words_initially = len(designations['blue'])
+            board_specs.num_second_player_words_initially = len(designations['red'])
+        board_specs.num_assassins_initially = len(designations['assassin'])
+        board_specs.num_civilians_initially = len(designations['civilian'])
+
+        board_specs.num_first_player_words_currently = board_specs.num_first_player_words_initially
+        board_specs.num_second_player_words_currently = board_specs.num_second_player_words_initially
+        board_specs.num_assassins_currently = board_specs.num_assassins_initially
+        board_specs.num_civilians_currently = board_specs.num_civilians_initially
+        return board_specs
+
+    def set_state(self, board, designations, first_player):
+        """ This method sets the board, the designations and the first player, along with all of the 'initially' and
+        'currently' class variables that are derived from them. """
         self.board = board
         self.designations_initially = designations
         self.first_player = first_player
-        self.red_words_initially = red_words
-        self.blue_words_initially = blue_words
-        self.assassin_words_initially = assassin_words
-        self.civilian_words_initially = civilian_words
+        self.red_words_initially = designations['red']
+        self.blue_words_initially = designations['blue']
+        self.assassin_words_initially = designations['assassin']
+        self.civilian_words_initially = designations['civilian']
 
         self.designations_currently = copy.deepcopy(self.designations_initially)
         self.red_words_currently = copy.deepcopy(self.red_words_initially)
@@ -107,8 +157,6 @@ class Board:
         self.assassin_words_currently = copy.deepcopy(self.assassin_words_initially)
         self.civilian_words_currently = copy.deepcopy(self.civilian_words_initially)
         self.current_turn = copy.deepcopy(self.first_player)
-
-        # The full description of a board is complete, so we are done.
         return
 
     # --------------------------------------------------------------------------------------
@@ -241,6 +289,12 @@ class Board:
                 final_list.append(word)
         return final_list
 
+    def get_remaining_words(self):
+        """ This method returns the words on the board that have not been guessed yet as a single list, in the same
+        order as they appear on the board. """
+        remaining_words = set(word for words in self.designations_currently.values() for word in words)
+        return [word for word in self.get_board_words() if word in remaining_words]
+
     def assassin_was_guessed(self):
         """ Checks to see if the assassin part of designations is empty.  If so, the assassin was guessed. """
         assassin_list = self.designations_currently['assassin']
@@ -8,12 +8,16 @@
 
 from Board import Board
 import helper_methods as helper
+from memory_profile import memory_phase
 
 
 class Codenames:
 
-    def __init__(self, red_model, blue_model, guesser_model, red_model_type, blue_model_type, guesser_model_type, red_model_score_threshold=0.18, blue_model_score_threshold=0.18):
-        """ This method initializes a Codenames game.  The models are set and the board is initialized as well. """
+    def __init__(self, red_model, blue_model, guesser_model, red_model_type, blue_model_type, guesser_model_type, red_model_score_threshold=0.18, blue_model_score_threshold=0.18, board_specs=None, seed=None, spymaster_mode='greedy'):
+        """ This method initializes a Codenames game.  The models are set and the board is initialized as well.  If
+        board_specs is given, that board is used instead of dealing a new random one.  Otherwise the board is dealt
+        with the given seed.  The spymaster_mode is either 'greedy', which picks the best clue each turn, or
+        'planner', which plans a sequence of clues over the remaining team words (see planner.py). """
         self.red_model = red_model
         self.blue_model = blue_model
         self.guesser_model = guesser_model
@@ -25,7 +29,12 @@ class Codenames:
         self.red_model_score_threshold = red_model_score_threshold
         self.blue_model_score_threshold = blue_model_score_threshold
 
-        self.board_specs = Board()
+        if board_specs is None:
+            board_specs = Board(seed=seed)
+        self.board_specs = board_specs
+
+        self.spymaster_mode = spymaster_mode
+        self.planners = {}
 
     # ======================================================================================
     # Helper methods for playing games.
@@ -117,6 +126,11 @@ class Codenames:
 
         for tuple in sorted_tuples:
             potential_code_word = tuple[0]
+            if self.guesser_model_type == 'guesser':
+                # Guesser backends can tell us directly whether they know the word.
+                if self.guesser_model.is_valid_word(potential_code_word):
+                    return tuple
+                continue
             try:
                 similarity = self.guesser_model.similarity('sample', potential_code_word)
                 # If we reach here, then the previous line of code must not have thrown an error, so we can end.
@@ -129,9 +143,24 @@ class Codenames:
         return ('ERROR', -1)
 
 
+    def get_planner(self, team):
+        """ Returns the clue planner for a team, creating it the first time it is needed. """
+        if team not in self.planners:
+            from planner import CluePlanner
+            model = self.red_model if team == 'red' else self.blue_model
+            self.planners[team] = CluePlanner(model, self.guesser_model, self.guesser_model_type)
+        return self.planners[team]
+
     def get_code_word(self, used_code_words):
         """ This method takes a model, its position (red or blue) and the current state of the board_specs, and it
          comes up with a codeword to present to the guesser.  A word and a number are returned."""
+        if self.spymaster_mode == 'planner':
+            team = self.board_specs.current_turn
+            planned_clue = self.get_planner(team).next_clue(self.board_specs, team, used_code_words)
+            if planned_clue is not None:
+                return planned_clue
+            # If the planner could not find any valid clue, we fall back to the greedy clue below.
+
         result_set = self.get_result_set(used_code_words)
         score_tuples = self.get_scores(result_set)
         score_tuples.sort(key=lambda x: x[1], reverse=True)
@@ -152,10 +181,17 @@ class Codenames:
         board_words = self.board_specs.get_board_words()
 
         if self.guesser_model_type == 'guesser':
-            # ==================================================================================
-            # TO DO: FILL IN WITH NEW WAY TO GET LIST OF GUESSES THAT IS NOT A WORD 2 VEC MODEL
-            # ==================================================================================
-            print("Need to fill this in.")
+            # The guesser model is one of the backends in guessers.py.  It only sees the words that are still live on
+            # the board and it hands back every one of them ranked, so we keep the top (intended_matches).  An
+            # intended_matches of zero or less (such as the -1 from an 'ERROR' code word) means no guesses at all.
+            if intended_matches <= 0:
+                return []
+            remaining_words = self.board_specs.get_remaining_words()
+            ranked_tuples = self.guesser_model.guess(code_word, remaining_words)
+
+            final_list = []
+            for tuple in ranked_tuples[0:intended_matches]:
+                final_list.append(tuple[0])
         elif self.guesser_model_type == 'word2vec':
 
             # We just find the top matches in the board to the code word and we select the top (intended_matches) of them.
@@ -190,8 +226,12 @@ class Codenames:
     # Methods to actually play the games.
     # ======================================================================================
 
-    def play_full_game(self):
-        """ This method plays a full game between the red model and the blue model using the guesser model."""
+    def play_full_game(self, game_log=None, accountant=None):
+        """ This method plays a full game between the red model and the blue model using the guesser model.  If a
+        GameLogWriter is given, the board and every turn are written to it so the game can be replayed.  If a
+        MemoryAccountant is given, the memory of each clue and each guess is measured. """
+        if game_log is not None:
+            game_log.start_game(self.board_specs, self.spymaster_mode)
 
         # We need to initialize the team going first.  The team going first is in the board_specs.
         if self.board_specs.first_player == 'red':
@@ -211,7 +251,8 @@ class Codenames:
             print("BLUE WORDS LEFT: ", self.board_specs.blue_words_currently)
 
             # For the team currently going, get a code word.
-            code_word, intended_matches = self.get_code_word(used_code_words)
+            with memory_phase(accountant, "clue"):
+                code_word, intended_matches = self.get_code_word(used_code_words)
 
             # Add code word to used_word_words to prevent the same code word from being used in the future.
             used_code_words.append(code_word)
@@ -220,11 +261,31 @@ class Codenames:
             print("CODE WORD: ", code_word)
             print("INTENDED MATCHES: ", intended_matches)
 
+            # If the guesser can not interpret any of the candidates, the board would never change and the same
+            # 'ERROR' code word would come back every turn.  The team that can not give a clue loses instead.
+            if code_word == 'ERROR':
+                print("No valid code word for", current_turn, "so", current_turn, "loses the game.")
+                if current_turn == 'red':
+                    winner = 'blue'
+                else:
+                    winner = 'red'
+                if game_log is not None:
+                    game_log.log_turn(current_turn, self.board_specs.current_turn, code_word, intended_matches, [])
+                    game_log.end_game(winner)
+                return winner
+
             # Have the guesser interpret the code word.
-            guessed_words = self.pick_words(code_word, intended_matches)
+            with memory_phase(accountant, "guess"):
+                guessed_words = self.pick_words(code_word, intended_matches)
 
             print("GUESSED WORDS: ", guessed_words)
 
+            # We log the team that is going along with the turn in the board_specs, since that is the side the code
+            # word was chosen for.
+            if game_log is not None:
+                game_log.log_turn(current_turn, self.board_specs.current_turn, code_word, intended_matches,
+                                  guessed_words)
+
             # Adjust the board_specs accordingly.
             self.update_board_specs(guessed_words)
 
@@ -236,6 +297,8 @@ class Codenames:
                     winner = 'blue'
                 else:
                     winner = 'red'
+                if game_log is not None:
+                    game_log.end_game(winner)
                 return winner
 
             # Assassin was not guessed, so prepare the next turn.
@@ -250,6 +313,8 @@ class Codenames:
         # We reach here once a win condition has been reached.
         # Now we find the winning team.
         winner = self.board_specs.determine_winner()
+        if game_log is not None:
+            game_log.end_game(winner)
 
         return winner
 
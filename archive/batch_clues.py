@@ -0,0 +1,341 @@
+# Name: batch_clues.py
+# Authors: Ryan C Hood and Shanjida Khatun
+#
+# Description: This python script contains the batch clue API.  It takes a list of board states (from OCR, from logs,
+# or from anywhere else) and returns a code word, a number and a ranked list of alternatives for each one.  It follows
+# the same steps as Codenames.get_code_word(), but the similarity searches and the scoring are done for a whole batch
+# of boards at once with matrix operations.
+#
+# A board state is a dict that looks like this:
+#
+#     {"designations": {"red": [...], "blue": [...], "assassin": [...], "civilian": [...]},
+#      "current_turn": "red",
+#      "used_code_words": [...],      (optional)
+#      "board": [...]}                (optional, every word on the board including the ones already guessed)
+
+import numpy as np
+
+import helper_methods as helper
+from vocab_tables import get_vocab_table
+
+
+class BatchClueGiver:
+    """ Gives clues for many boards with one embedding model.  Building one normalizes the restricted vocabulary of the
+    model, so it should be built once per model and then reused (see get_clue_giver()). """
+
+    def __init__(self, model, guesser_model, guesser_model_type='guesser', restrict_vocab=50000, topn=100,
+                 vocab_table=None):
+        self.model = model
+        self.guesser_model = guesser_model
+        self.guesser_model_type = guesser_model_type
+        self.topn = topn
+
+        # If a VocabTable (see vocab_tables.py) is given, candidates are filtered with its masks instead of running
+        # the string pipeline in helper_methods.
+        self.vocab_table = vocab_table
+
+        # Unit vectors of the rows code words are drawn from.  This matches most_similar(restrict_vocab=...).
+        self.restrict_vocab = min(restrict_vocab, len(model.index_to_key))
+        self.vocab_vectors = unit_rows(np.asarray(model.vectors[:self.restrict_vocab], dtype=np.float32))
+
+        # The table is indexed by the same rows the similarity search returns, so it has to cover exactly those rows.
+        assert vocab_table is None or vocab_table.num_rows == self.restrict_vocab, \
+            "The vocab table covers " + str(vocab_table.num_rows) + " rows but restrict_vocab is " + \
+            str(self.restrict_vocab) + "."
+
+    # ------------------------------ Lookups ------------------------------------------------
+
+    def get_word_ids(self, words):
+        """ Returns the model row of each word, or -1 for words the model does not know. """
+        key_to_index = self.model.key_to_index
+        return np.array([key_to_index.get(word, -1) for word in words], dtype=np.int64)
+
+    def get_unit_vectors(self, word_ids):
+        """ Returns the unit vectors of an array of model rows of any shape.  Rows of -1 get a zero vector. """
+        safe_ids = np.maximum(word_ids, 0)
+        vectors = unit_rows(np.asarray(self.model.vectors[safe_ids.ravel()], dtype=np.float32))
+        vectors[word_ids.ravel() < 0] = 0
+        return vectors.reshape(word_ids.shape + (vectors.shape[-1],))
+
+    def is_valid_for_guesser(self, word):
+        """ Returns True if the guesser model can interpret the word, as in Codenames.find_best_valid_word(). """
+        if self.vocab_table is not None and word in self.vocab_table.lowercase_to_canonical:
+            return bool(self.vocab_table.table['guesser_valid'][self.vocab_table.lowercase_to_canonical[word]])
+        if self.guesser_model_type == 'guesser':
+            return self.guesser_model.is_valid_word(word)
+        return word in self.guesser_model.key_to_index
+
+    # ------------------------------ Candidate generation -----------------------------------
+
+    def most_similar_batch(self, positive_lists, negative_lists):
+        """ The batched version of model.most_similar(positive, negative, restrict_vocab, topn).  Returns, for each
+        board, a list of (word, similarity) tuples. """
+        top_id_lists, similarity_lists = self.most_similar_ids_batch(positive_lists, negative_lists)
+
+        index_to_key = self.model.index_to_key
+        result_sets = []
+        for top_ids, similarities in zip(top_id_lists, similarity_lists):
+            result_sets.append([(index_to_key[word_id], float(similarity))
+                                for word_id, similarity in zip(top_ids, similarities)])
+        return result_sets
+
+    def most_similar_ids_batch(self, positive_lists, negative_lists):
+        """ The same as most_similar_batch(), but returns an array of vocabulary rows and an array of similarities for
+        each board instead of building any strings. """
+        num_boards = len(positive_lists)
+        queries = np.zeros((num_boards, self.vocab_vectors.shape[1]), dtype=np.float32)
+        input_ids = []
+
+        for board_index in range(0, num_boards):
+            positive_ids = self.get_word_ids(positive_lists[board_index])
+            negative_ids = self.get_word_ids(negative_lists[board_index])
+            for word, word_id in zip(list(positive_lists[board_index]) + list(negative_lists[board_index]),
+                                     list(positive_ids) + list(negative_ids)):
+                if word_id < 0:
+                    # most_similar() raises a KeyError for unknown words, so we do the same.
+                    raise KeyError("Key '" + word + "' not present in the model.")
+            # The query is the sum of the positive unit vectors minus the sum of the negative unit vectors.
+            queries[board_index] = (self.get_unit_vectors(positive_ids).sum(axis=0)
+                                    - self.get_unit_vectors(negative_ids).sum(axis=0))
+            input_ids.append(np.concatenate([positive_ids, negative_ids]))
+
+        # One matrix product scores the whole restricted vocabulary for every board in the batch.
+        similarities = unit_rows(queries) @ self.vocab_vectors.T
+
+        # most_similar() never returns the words it was asked about.
+        for board_index, ids in enumerate(input_ids):
+            ids = ids[ids < self.restrict_vocab]
+            similarities[board_index, ids] = -np.inf
+
+        top_ids = top_k_indices(similarities, self.topn)
+        top_similarities = np.take_along_axis(similarities, top_ids, axis=1)
+
+        top_id_lists = []
+        similarity_lists = []
+        for board_index in range(0, num_boards):
+            is_result = top_similarities[board_index] != -np.inf
+            top_id_lists.append(top_ids[board_index][is_result])
+            similarity_lists.append(top_similarities[board_index][is_result])
+        return top_id_lists, similarity_lists
+
+    # ------------------------------ Scoring ------------------------------------------------
+
+    def get_scores_batch(self, result_sets, words_to_match_lists, score_threshold):
+        """ The batched version of Codenames.get_scores().  A candidate scores one point for every team word it has a
+        similarity above the threshold with. """
+        num_boards = len(result_sets)
+        max_candidates = max([len(result_set) for result_set in result_sets] + [1])
+        max_team_words = max([len(words) for words in words_to_match_lists] + [1])
+
+        candidate_ids = np.full((num_boards, max_candidates), -1, dtype=np.int64)
+        team_ids = np.full((num_boards, max_team_words), -1, dtype=np.int64)
+        for board_index in range(0, num_boards):
+            words = [tup[0] for tup in result_sets[board_index]]
+            candidate_ids[board_index, :len(words)] = self.get_word_ids(words)
+            team_words = words_to_match_lists[board_index]
+            team_ids[board_index, :len(team_words)] = self.get_word_ids(team_words)
+
+        # Unknown words have zero vectors, so their similarity is 0, which is what get_scores() gives them as well.
+        similarities = np.einsum('bkd,btd->bkt', self.get_unit_vectors(candidate_ids), self.get_unit_vectors(team_ids))
+        scores = (similarities > score_threshold).sum(axis=2)
+
+        score_tuple_lists = []
+        for board_index in range(0, num_boards):
+            score_tuple_lists.append([(tup[0], int(scores[board_index, candidate_index]))
+                                      for candidate_index, tup in enumerate(result_sets[board_index])])
+        return score_tuple_lists
+
+    # ------------------------------ Putting it together ------------------------------------
+
+    def get_clues(self, board_states, score_threshold=0.18, num_alternatives=10, batch_size=256):
+        """ Returns a clue for every board state.  Each clue is a dict with the code word, the number, and the
+        alternatives, which are the best (word, score) tuples that the guesser is able to interpret. """
+        clues = []
+        for start in range(0, len(board_states), batch_size):
+            clues.extend(self.get_clues_for_chunk(board_states[start:start + batch_size], score_threshold,
+                                                  num_alternatives))
+        return clues
+
+    def get_clues_for_chunk(self, board_states, score_threshold, num_alternatives):
+        """ Does the work of get_clues() for one chunk of boards, so the similarity matrices stay a reasonable size.
+        most_similar() raises a KeyError for a word the model does not know, so a board with one (a two word card,
+        or an OCR misread) gets an 'ERROR' clue with the reason, and the rest of the chunk is still worked out. """
+        clues = [None] * len(board_states)
+        known_indices = []
+        for index, state in enumerate(board_states):
+            unknown_words = self.get_unknown_words(state)
+            if unknown_words:
+                clues[index] = {"code_word": 'ERROR', "number": -1, "alternatives": [],
+                                "error": "Key '" + unknown_words[0] + "' not present in the model."}
+            else:
+                known_indices.append(index)
+
+        if known_indices:
+            known_clues = self.get_clues_for_known_boards([board_states[index] for index in known_indices],
+                                                          score_threshold, num_alternatives)
+            for index, clue in zip(known_indices, known_clues):
+                clues[index] = clue
+        return clues
+
+    def get_unknown_words(self, board_state):
+        """ Returns the words of a board that the similarity searches need but the model does not know. """
+        team = board_state['current_turn']
+        other_team = 'blue' if team == 'red' else 'red'
+        designations = board_state['designations']
+        words = list(designations[team]) + list(designations[other_team]) + list(designations['assassin'])
+        return [word for word in words if word not in self.model.key_to_index]
+
+    def get_clues_for_known_boards(self, board_states, score_threshold, num_alternatives):
+        """ Works out the clues for boards whose words are all known to the model. """
+        teams = [state['current_turn'] for state in board_states]
+        other_teams = ['blue' if team == 'red' else 'red' for team in teams]
+        designations = [state['designations'] for state in board_states]
+
+        # STEP 1 and STEP 2: Candidate code words, cleaned up the same way as in Codenames.get_result_set().
+        positive_lists = [designations[index][teams[index]] for index in range(0, len(teams))]
+        negative_lists = [designations[index][other_teams[index]] for index in range(0, len(teams))]
+        assassin_lists = [designation['assassin'] for designation in designations]
+        if self.vocab_table is None:
+            result_sets = self.get_result_sets(board_states, positive_lists, negative_lists, assassin_lists)
+        else:
+            result_sets = self.get_result_sets_with_table(board_states, positive_lists, negative_lists, assassin_lists)
+
+        # STEP 3: Score the candidates and pick the best ones the guesser can interpret.
+        score_tuple_lists = self.get_scores_batch(result_sets, [designations[index][teams[index]]
+                                                                for index in range(0, len(teams))], score_threshold)
+        clues = []
+        for score_tuples in score_tuple_lists:
+            # A stable sort, so equal scores keep the order of the similarity search, as in get_code_word().
+            score_tuples.sort(key=lambda x: x[1], reverse=True)
+            alternatives = []
+            for tup in score_tuples:
+                if self.is_valid_for_guesser(tup[0]):
+                    alternatives.append(tup)
+                    if len(alternatives) == num_alternatives:
+                        break
+
+            if alternatives:
+                code_word, number = alternatives[0]
+            else:
+                print("ERROR in get_clues().  None of the potential words are keys in the guesser model.")
+                code_word, number = 'ERROR', -1
+            clues.append({"code_word": code_word, "number": number, "alternatives": alternatives})
+        return clues
+
+    def get_result_sets(self, board_states, positive_lists, negative_lists, assassin_lists):
+        """ Finds the candidates and the bad words that come from the assassin, and then runs the string pipeline
+        from helper_methods on them. """
+        result_sets = self.most_similar_batch(positive_lists, negative_lists)
+        bad_sets = self.most_similar_batch(assassin_lists, [[] for _ in assassin_lists])
+
+        for index, state in enumerate(board_states):
+            used_code_words = state.get('used_code_words', [])
+            result_set = helper.remove_used_code_words(result_sets[index], used_code_words)
+            bad_set = helper.remove_used_code_words(bad_sets[index], used_code_words)
+            result_sets[index] = helper.full_pipeline(get_all_board_words(state), result_set, bad_set)
+        return result_sets
+
+    def get_result_sets_with_table(self, board_states, positive_lists, negative_lists, assassin_lists):
+        """ The same as get_result_sets(), but the filtering is done on vocabulary rows with the masks in the vocab
+        table.  Strings are only made for the candidates that survive. """
+        top_id_lists, similarity_lists = self.most_similar_ids_batch(positive_lists, negative_lists)
+        bad_id_lists, _ = self.most_similar_ids_batch(assassin_lists, [[] for _ in assassin_lists])
+
+        index_to_key = self.model.index_to_key
+        result_sets = []
+        for index, state in enumerate(board_states):
+            used_ids = self.vocab_table.get_canonical_ids(state.get('used_code_words', []))
+            board_ids = self.vocab_table.get_board_ids(get_all_board_words(state))
+
+            # Surviving rows are canonical, and remove_repeats keeps the first row of each lowercase word, so the
+            # similarity to keep is the one at the first position of each canonical row.
+            canonical_ids = self.vocab_table.table['canonical_id'][top_id_lists[index]]
+            unique_ids, first_positions = np.unique(canonical_ids, return_index=True)
+            similarity_by_id = dict(zip(unique_ids.tolist(), similarity_lists[index][first_positions].tolist()))
+
+            kept_ids = self.vocab_table.filter_candidates(top_id_lists[index], used_ids, board_ids,
+                                                          bad_id_lists[index])
+            result_sets.append([(index_to_key[word_id].lower(), similarity_by_id[word_id])
+                                for word_id in kept_ids.tolist()])
+        return result_sets
+
+
+# ====================================================================================================================
+# Public API
+# ====================================================================================================================
+
+# Clue givers are expensive to build, so we keep one per (model, guesser) pair.
+clue_giver_cache = {}
+
+
+def get_clue_giver(model, guesser_model, guesser_model_type='guesser', restrict_vocab=50000, topn=100,
+                   vocab_table=None, use_vocab_table=True):
+    """ Returns the cached BatchClueGiver for the model, building it the first time.  If no vocab_table is given, the
+    cached one from vocab_tables.get_vocab_table() is used, unless use_vocab_table is False, in which case the
+    candidates go through the string pipeline.  Tables are told apart by the name of their shared memory, so a process
+    that attaches to a table finds the clue giver built before it forked. """
+    if vocab_table is None and use_vocab_table:
+        vocab_table = get_vocab_table(model, guesser_model, guesser_model_type, restrict_vocab)
+    table_name = vocab_table.name if vocab_table is not None else None
+    key = (id(model), id(guesser_model), guesser_model_type, restrict_vocab, topn, table_name)
+    if key not in clue_giver_cache:
+        clue_giver_cache[key] = BatchClueGiver(model, guesser_model, guesser_model_type, restrict_vocab, topn,
+                                               vocab_table)
+    return clue_giver_cache[key]
+
+
+def get_clues(board_states, red_model, blue_model, guesser_model, guesser_model_type='guesser',
+              red_model_score_threshold=0.18, blue_model_score_threshold=0.18, num_alternatives=10, batch_size=256,
+              vocab_tables=None, use_vocab_tables=True):
+    """ Computes a clue for every board state in one call.  As in a Codenames game, boards where it is red's turn use
+    the red model and boards where it is blue's turn use the blue model.  The clues come back in the same order as
+    the board states.  A board with a word the model does not know gets the code word 'ERROR' and an "error" entry.
+
+    vocab_tables can map 'red' and 'blue' to the VocabTable of each model (a worker attached to shared tables passes
+    them here).  Otherwise each model's table is built the first time it is needed and then cached.  With
+    use_vocab_tables=False the candidates go through the string pipeline in helper_methods instead. """
+    if vocab_tables is None:
+        vocab_tables = {}
+    clues = [None] * len(board_states)
+    for team, model, score_threshold in [('red', red_model, red_model_score_threshold),
+                                         ('blue', blue_model, blue_model_score_threshold)]:
+        indices = [index for index, state in enumerate(board_states) if state['current_turn'] == team]
+        if not indices:
+            continue
+        clue_giver = get_clue_giver(model, guesser_model, guesser_model_type, vocab_table=vocab_tables.get(team),
+                                    use_vocab_table=use_vocab_tables)
+        team_clues = clue_giver.get_clues([board_states[index] for index in indices], score_threshold,
+                                          num_alternatives, batch_size)
+        for index, clue in zip(indices, team_clues):
+            clues[index] = clue
+    return clues
+
+
+# ====================================================================================================================
+# Other methods
+# ====================================================================================================================
+
+def get_all_board_words(board_state):
+    """ Returns every word on the board as one list.  If the state has no board, the live words are used. """
+    board = board_state.get('board')
+    if board is None:
+        return [word for words in board_state['designations'].values() for word in words]
+    if board and isinstance(board[0], list):
+        return [word for row in board for word in row]
+    return list(board)
+
+
+def unit_rows(matrix):
+    """ Scales every row of the matrix to length 1.  Rows of all zeros are left alone. """
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def top_k_indices(scores, k):
+    """ Returns the column indices of the k largest scores in each row, best first. """
+    k = min(k, scores.shape[1])
+    partitioned = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    partitioned_scores = np.take_along_axis(scores, partitioned, axis=1)
+    order = np.argsort(-partitioned_scores, axis=1, kind='stable')
+    return np.take_along_axis(partitioned, order, axis=1)
@@ -0,0 +1,92 @@
+# Name: game_log.py
+# Authors: Ryan C Hood and Shanjida Khatun
+#
+# Description: This python script contains the game log format.  A game log is a JSONL file with one line per game:
+#
+#     {"seed": 12, "spymaster_mode": "greedy", "board": [[...], ...], "first_player": "red",
+#      "designations": {"red": [...], "blue": [...], "assassin": [...], "civilian": [...]},
+#      "turns": [{"team": "blue", "current_turn": "red", "code_word": "...", "number": 3, "guesses": [...]}, ...],
+#      "winner": "blue"}
+#
+# The spymaster_mode is the one the game was played with (see Codenames.py).  Logs written before it was recorded only
+# have greedy games.  The designations are the ones at the start of the game.  The state before any turn can be
+# rebuilt by removing the guesses of the earlier turns, and the used code words are the code words of the earlier
+# turns.
+#
+# In a turn, "team" is the team that gave the clue and whose guesses were made.  "current_turn" is the side the clue
+# was computed for, which is board_specs.current_turn.  Codenames.play_full_game() does not move
+# board_specs.current_turn on between turns, so the two are not always the same, and a replay has to use
+# "current_turn" to get the same clue back.  Logs written before "team" was recorded do not have it.
+
+import copy
+import json
+
+
+class GameLogWriter:
+    """ Writes games to a JSONL game log.  A game is written out once it ends. """
+
+    def __init__(self, file_name, append=True):
+        self.log_file = open(file_name, "a" if append else "w")
+        self.current_game = None
+
+    def start_game(self, board_specs, spymaster_mode='greedy'):
+        self.current_game = {"seed": board_specs.seed,
+                             "spymaster_mode": spymaster_mode,
+                             "board": copy.deepcopy(board_specs.board),
+                             "first_player": board_specs.first_player,
+                             "designations": copy.deepcopy(board_specs.designations_initially),
+                             "turns": []}
+
+    def log_turn(self, team, current_turn, code_word, number, guesses):
+        self.current_game["turns"].append({"team": team,
+                                           "current_turn": current_turn,
+                                           "code_word": code_word,
+                                           "number": number,
+                                           "guesses": list(guesses)})
+
+    def end_game(self, winner):
+        self.current_game["winner"] = winner
+        self.log_file.write(json.dumps(self.current_game, separators=(",", ":")) + "\n")
+        self.log_file.flush()
+        self.current_game = None
+
+    def close(self):
+        self.log_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_game_log(file_name):
+    """ Returns the list of games in a game log. """
+    games = []
+    with open(file_name) as log_file:
+        for line in log_file:
+            if line.strip():
+                games.append(json.loads(line))
+    return games
+
+
+def get_turn_states(game):
+    """ Rebuilds the board state before each turn of a logged game.  Returns a list of (board_state, turn) pairs,
+    where the board state is in the format the batch clue API takes (see batch_clues.py). """
+    designations = copy.deepcopy(game["designations"])
+    used_code_words = []
+    turn_states = []
+    for turn in game["turns"]:
+        board_state = {"board": game["board"],
+                       "designations": copy.deepcopy(designations),
+                       "current_turn": turn["current_turn"],
+                       "used_code_words": list(used_code_words)}
+        turn_states.append((board_state, turn))
+
+        # Apply the turn, the same way Board.remove_word_from_designation() does.
+        for guess in turn["guesses"]:
+            for words in designations.values():
+                if guess in words:
+                    words.remove(guess)
+        used_code_words.append(turn["code_word"])
+    return turn_states
@@ -0,0 +1,217 @@
+# Name: guessers.py
+# Authors: Ryan C Hood and Shanjida Khatun
+#
+# Description: This python script contains the guesser backends.  A guesser takes a batch of queries, where each
+# query is a code word together with the words still live on the board, and returns the board words ranked from
+# best guess to worst guess.  Every backend answers the whole batch with a handful of array operations rather than
+# looping over the board words one at a time in Python.
+
+import re
+from collections import Counter
+
+import numpy as np
+
+
+class Guesser:
+    """ Base class for every guesser backend.  Subclasses only need to implement score_batch() and is_valid_word(). """
+
+    def guess_batch(self, queries):
+        """ Takes a list of (code_word, board_words) queries and returns, for each query, a list of
+        (board_word, score) tuples sorted from best guess to worst guess. """
+        if not queries:
+            return []
+
+        # All queries are padded to the same number of board words so the whole batch is one matrix.
+        max_board_size = max(len(board_words) for _, board_words in queries)
+        scores = self.score_batch(queries, max_board_size)
+
+        # Pad entries get -inf so that they sort after every real board word.  The sort is stable, which keeps
+        # board order for ties, just as list.sort() does in the word2vec guesser.
+        order = np.argsort(-scores, axis=1, kind='stable')
+
+        ranked_lists = []
+        for query_index, (code_word, board_words) in enumerate(queries):
+            ranked = []
+            for board_index in order[query_index]:
+                if board_index >= len(board_words):
+                    continue
+                ranked.append((board_words[board_index], float(scores[query_index, board_index])))
+            ranked_lists.append(ranked)
+        return ranked_lists
+
+    def guess(self, code_word, board_words):
+        """ Convenience method for a single query. """
+        return self.guess_batch([(code_word, board_words)])[0]
+
+    def score_batch(self, queries, max_board_size):
+        """ Returns a (num_queries, max_board_size) float array of scores.  Higher is a better guess and padded
+        entries must be -inf. """
+        raise NotImplementedError
+
+    def is_valid_word(self, word):
+        """ Returns True if the guesser is able to interpret the word as a code word. """
+        raise NotImplementedError
+
+
+class EmbeddingGuesser(Guesser):
+    """ A cached wrapper around a gensim KeyedVectors model, which is the guesser we have been using so far.  The unit
+    vector of each word is looked up once and then kept, since the same board words come up on every turn. """
+
+    def __init__(self, model):
+        self.model = model
+        self.vector_cache = {}
+
+    def get_unit_vector(self, word):
+        """ Returns the cached unit vector of the word, or None if the word is not in the model. """
+        if word in self.vector_cache:
+            return self.vector_cache[word]
+        if word in self.model.key_to_index:
+            vector = self.model.get_vector(word, norm=True).astype(np.float32)
+        else:
+            vector = None
+        self.vector_cache[word] = vector
+        return vector
+
+    def is_valid_word(self, word):
+        # Only a key lookup, so checking a whole vocabulary does not fill up the vector cache.
+        return word in self.model.key_to_index
+
+    def score_batch(self, queries, max_board_size):
+        vector_size = self.model.vector_size
+        num_queries = len(queries)
+
+        code_vectors = np.zeros((num_queries, vector_size), dtype=np.float32)
+        board_vectors = np.zeros((num_queries, max_board_size, vector_size), dtype=np.float32)
+        is_known = np.zeros((num_queries, max_board_size), dtype=bool)
+
+        for query_index, (code_word, board_words) in enumerate(queries):
+            code_vector = self.get_unit_vector(code_word)
+            if code_vector is not None:
+                code_vectors[query_index] = code_vector
+            for board_index, board_word in enumerate(board_words):
+                board_vector = self.get_unit_vector(board_word)
+                if board_vector is not None:
+                    board_vectors[query_index, board_index] = board_vector
+                    is_known[query_index, board_index] = True
+
+        # Cosine similarity of every code word with every one of its board words in a single call.
+        scores = np.einsum('qd,qnd->qn', code_vectors, board_vectors)
+
+        # Board words that the model does not know are still real guesses, they are just the least likely ones.
+        is_real = np.zeros((num_queries, max_board_size), dtype=bool)
+        for query_index, (_, board_words) in enumerate(queries):
+            is_real[query_index, :len(board_words)] = True
+        scores[is_real & ~is_known] = -1.0
+        scores[~is_real] = -np.inf
+        return scores
+
+
+class CooccurrenceGuesser(Guesser):
+    """ A guesser that is not a word embedding.  It counts how often words appear near each other in a local text
+    corpus and scores a board word by its positive pointwise mutual information (PPMI) with the code word.  The PPMI
+    table is a scipy sparse matrix, so only pairs of words that actually co-occur take up memory. """
+
+    def __init__(self, vocabulary, ppmi_matrix):
+        self.vocabulary = vocabulary
+        self.word_to_index = {word: index for index, word in enumerate(vocabulary)}
+        self.ppmi_matrix = ppmi_matrix.tocsr()
+
+    @classmethod
+    def from_corpus_file(cls, corpus_file_name, window_size=5, min_count=5, max_vocab_size=100000):
+        """ Builds the guesser from a plain text file.  Each line of the file is treated as its own document, so
+        words are never paired across a line break. """
+        # Import here so that scipy is only loaded by the people who actually build this guesser.
+        from scipy import sparse
+
+        # STEP 1: Tokenize the corpus into lowercase, alphabetical words.
+        token_pattern = re.compile(r"[a-z]+")
+        documents = []
+        word_counts = Counter()
+        with open(corpus_file_name) as corpus_file:
+            for line in corpus_file:
+                tokens = token_pattern.findall(line.lower())
+                if tokens:
+                    documents.append(tokens)
+                    word_counts.update(tokens)
+
+        # STEP 2: Keep the most common words as our vocabulary.
+        vocabulary = [word for word, count in word_counts.most_common(max_vocab_size) if count >= min_count]
+        word_to_index = {word: index for index, word in enumerate(vocabulary)}
+
+        # STEP 3: Turn the corpus into one flat array of word ids along with the document each token came from.
+        token_ids = []
+        document_ids = []
+        for document_index, tokens in enumerate(documents):
+            ids = [word_to_index[token] for token in tokens if token in word_to_index]
+            token_ids.extend(ids)
+            document_ids.extend([document_index] * len(ids))
+        token_ids = np.array(token_ids, dtype=np.int64)
+        document_ids = np.array(document_ids, dtype=np.int64)
+
+        # STEP 4: Count co-occurrences.  Shifting the token array by each offset in the window gives every pair at
+        # that distance at once, and we only keep the pairs that fall inside the same document.
+        rows = []
+        columns = []
+        for offset in range(1, window_size + 1):
+            same_document = document_ids[:-offset] == document_ids[offset:]
+            left = token_ids[:-offset][same_document]
+            right = token_ids[offset:][same_document]
+            rows.extend([left, right])
+            columns.extend([right, left])
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        columns = np.concatenate(columns) if columns else np.zeros(0, dtype=np.int64)
+
+        vocab_size = len(vocabulary)
+        counts = sparse.coo_matrix((np.ones(len(rows), dtype=np.float64), (rows, columns)),
+                                   shape=(vocab_size, vocab_size)).tocsr()
+        counts.sum_duplicates()
+
+        return cls(vocabulary, compute_ppmi(counts))
+
+    def is_valid_word(self, word):
+        return word in self.word_to_index
+
+    def score_batch(self, queries, max_board_size):
+        num_queries = len(queries)
+        code_ids = np.full(num_queries, -1, dtype=np.int64)
+        board_ids = np.full((num_queries, max_board_size), -1, dtype=np.int64)
+        is_real = np.zeros((num_queries, max_board_size), dtype=bool)
+
+        for query_index, (code_word, board_words) in enumerate(queries):
+            code_ids[query_index] = self.word_to_index.get(code_word, -1)
+            for board_index, board_word in enumerate(board_words):
+                board_ids[query_index, board_index] = self.word_to_index.get(board_word, -1)
+            is_real[query_index, :len(board_words)] = True
+
+        # Unknown words look up row/column 0 and are then masked out below, so the lookup stays one sparse gather.
+        is_known = is_real & (board_ids >= 0) & (code_ids[:, None] >= 0)
+        safe_code_ids = np.maximum(code_ids, 0)
+        safe_board_ids = np.maximum(board_ids, 0)
+        scores = self.ppmi_matrix[safe_code_ids[:, None], safe_board_ids]
+        # Depending on the scipy version this gather comes back as a dense matrix or as a sparse matrix.
+        scores = scores.toarray() if hasattr(scores, 'toarray') else np.asarray(scores)
+        scores = scores.astype(np.float64)
+
+        # PPMI is never negative, so -1 puts unknown words after every word we know anything about.
+        scores[is_real & ~is_known] = -1.0
+        scores[~is_real] = -np.inf
+        return scores
+
+
+def compute_ppmi(counts):
+    """ Takes a sparse matrix of co-occurrence counts and returns the sparse matrix of positive pointwise mutual
+    information.  Only the stored entries are touched, so this stays sparse the whole way through. """
+    counts = counts.tocoo()
+    total = counts.sum()
+    row_totals = np.asarray(counts.sum(axis=1)).ravel()
+    column_totals = np.asarray(counts.sum(axis=0)).ravel()
+
+    pmi = np.log(counts.data * total / (row_totals[counts.row] * column_totals[counts.col]))
+    keep = pmi > 0
+
+    ppmi = counts.copy()
+    ppmi.data = pmi
+    ppmi.data[~keep] = 0
+    ppmi = ppmi.tocsr()
+    ppmi.eliminate_zeros()
+    return ppmi
@@ -3,7 +3,18 @@
 #
 # Description: This python script contains some helper methods that did not have a better home anywhere else!
 
-import inflect
+# inflect is imported the first time a plural form is needed rather than when this module is imported, so that
+# scripts which never run the pipeline do not pay for it.
+inflect_engine = None
+
+
+def get_inflect_engine():
+    """ Returns the shared inflect engine, creating it on first use. """
+    global inflect_engine
+    if inflect_engine is None:
+        import inflect
+        inflect_engine = inflect.engine()
+    return inflect_engine
 
 
 # ====================================================================================================================
@@ -48,7 +59,7 @@ def remove_plural_copies(result_set):
     """ This method removes the "plural copies" from the result set, so we don't have essential copies of every
      word in the result set. """
     # We use the inflect library to get plural forms.
-    p = inflect.engine()
+    p = get_inflect_engine()
 
     # trouble_indices will hold the indices that need to be removed.
     trouble_indices = []
@@ -83,7 +94,7 @@ def remove_board_words(all_board_words, result_set):
     """ This method removes the plural version of words on the board from the result set.  We are not allowed to use
      them as code words! """
     # As before, we use inflect to get plural forms.
-    p = inflect.engine()
+    p = get_inflect_engine()
 
     # The first step is to pluralize all of the board words.
     plural_board_words = []
@@ -0,0 +1,174 @@
+# Name: memory_profile.py
+# Authors: Ryan C Hood and Shanjida Khatun
+#
+# Description: This python script contains the memory accounting mode.  A MemoryAccountant takes tracemalloc snapshots
+# at phase boundaries (loading each model, setting up each game, each clue, each guess), so we can see what the
+# models, the per game Board and Codenames objects, and the per turn temporaries each cost.  It also contains
+# plan_for_budget(), which picks a vocabulary limit and a worker count that fit in a given amount of memory.
+
+import contextlib
+import os
+import sys
+import tracemalloc
+
+# Rough cost of one vocabulary entry besides its vector: the key string, its entry in key_to_index and in
+# index_to_key.
+BYTES_PER_VOCAB_ENTRY = 150
+
+
+class MemoryAccountant:
+
+    def __init__(self, num_frames=1):
+        """ Starts tracemalloc.  Only one accountant should be running at a time. """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(num_frames)
+        # phase name -> [times run, total bytes kept, largest peak bytes, largest RSS after]
+        self.phases = {}
+        # phase name -> the files that kept the most memory, from the snapshots
+        self.top_files = {}
+        # component name -> bytes
+        self.components = {}
+
+    @contextlib.contextmanager
+    def phase(self, name, take_snapshots=False):
+        """ Measures the memory kept and the peak memory of everything that runs inside the with block.  With
+        take_snapshots, tracemalloc snapshots are also compared to find which files kept the memory.  Snapshots of a
+        heap holding the models take a while, so they are meant for the big phases like loading, not for every turn. """
+        before = tracemalloc.take_snapshot() if take_snapshots else None
+        tracemalloc.reset_peak()
+        start_current, _ = tracemalloc.get_traced_memory()
+        try:
+            yield
+        finally:
+            end_current, peak = tracemalloc.get_traced_memory()
+            kept = end_current - start_current
+            if take_snapshots:
+                stats = tracemalloc.take_snapshot().compare_to(before, 'filename')
+                self.top_files[name] = [str(stat) for stat in stats[:5]]
+
+            record = self.phases.setdefault(name, [0, 0, 0, 0])
+            record[0] = record[0] + 1
+            record[1] = record[1] + kept
+            record[2] = max(record[2], peak - start_current)
+            record[3] = max(record[3], get_rss())
+
+    def record_component(self, name, obj, exclude=()):
+        """ Records the size of an object, such as a loaded model.  If the same name is recorded more than once, the
+        largest size is kept. """
+        self.components[name] = max(self.components.get(name, 0), get_size(obj, exclude=exclude))
+
+    def print_report(self):
+        print("MEMORY REPORT")
+        print("  Peak RSS: ", format_bytes(get_peak_rss()))
+        print("  Components:")
+        for name, size in self.components.items():
+            print("    {:<24} {:>12}".format(name, format_bytes(size)))
+        print("  Phases:                  runs   kept (mean)   peak (max)    RSS (max)")
+        for name, (runs, kept, peak, rss) in self.phases.items():
+            print("    {:<20} {:>8} {:>13} {:>12} {:>12}".format(name, runs, format_bytes(kept / runs),
+                                                               format_bytes(peak), format_bytes(rss)))
+        for name, top_files in self.top_files.items():
+            print("  Largest allocations in '" + name + "':")
+            for line in top_files:
+                print("    " + line)
+        return
+
+
+def memory_phase(accountant, name, take_snapshots=False):
+    """ Returns accountant.phase(name, take_snapshots), or a context that does nothing if there is no accountant. """
+    if accountant is None:
+        return contextlib.nullcontext()
+    return accountant.phase(name, take_snapshots)
+
+
+# ====================================================================================================================
+# Sizes
+# ====================================================================================================================
+
+def get_size(obj, seen=None, exclude=()):
+    """ Returns the size of an object in bytes, following its attributes and contents.  numpy arrays and scipy sparse
+    matrices are counted by their buffers (numpy arrays already report their buffer to getsizeof()).  Each object is
+    only counted once, and the objects in exclude (such as the models a Codenames game points to) are not counted at
+    all. """
+    if seen is None:
+        seen = set(id(excluded) for excluded in exclude)
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if hasattr(obj, 'indptr') and hasattr(obj, 'data') and hasattr(obj, 'indices'):
+        return obj.data.nbytes + obj.indices.nbytes + obj.indptr.nbytes
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size = size + sum(get_size(key, seen) + get_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size = size + sum(get_size(item, seen) for item in obj)
+    elif hasattr(obj, '__dict__'):
+        size = size + get_size(vars(obj), seen)
+    return size
+
+
+def get_rss():
+    """ Returns the current resident set size of this process in bytes. """
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return get_peak_rss()
+
+
+def get_peak_rss():
+    """ Returns the peak resident set size of this process in bytes, or 0 where it can not be measured. """
+    # resource only exists on Unix, and Codenames.py imports this module on every platform.
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and macOS reports bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def format_bytes(num_bytes):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(num_bytes) < 1024 or unit == "GB":
+            return "{:.1f} {}".format(num_bytes, unit)
+        num_bytes = num_bytes / 1024
+
+
+# ====================================================================================================================
+# Budget mode
+# ====================================================================================================================
+
+def plan_for_budget(budget_bytes, vector_sizes=(300, 100, 300), max_vocab=500000, restrict_vocab=50000,
+                    chunk_size=256, max_workers=None, base_bytes=300 * 1024 * 1024):
+    """ Picks a vocabulary limit for the models and a number of replay workers so everything fits in budget_bytes.
+    vector_sizes are the dimensions of the models that will be loaded (red, blue and guesser by default).
+
+    The models are loaded once and shared with forked workers, so they are paid for once.  Each worker then needs its
+    similarity matrices: chunk_size x restrict_vocab floats for the candidates and the same again for the bad words.
+    Returns a dict with 'vocab_limit' and 'num_workers'.  A ValueError is raised if even the smallest plan does not
+    fit. """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    bytes_per_row = sum(4 * vector_size + BYTES_PER_VOCAB_ENTRY for vector_size in vector_sizes)
+    # The clue givers keep a normalized copy of the restricted vocabulary of the red and blue models.
+    clue_giver_bytes = sum(4 * vector_size * restrict_vocab for vector_size in vector_sizes[:2])
+    per_worker_bytes = 2 * 4 * chunk_size * restrict_vocab + base_bytes // 4
+
+    # Give the models as much of the budget as we can while still leaving room for one worker.
+    available = budget_bytes - base_bytes - clue_giver_bytes - per_worker_bytes
+    vocab_limit = min(max_vocab, available // bytes_per_row) if available > 0 else 0
+    if vocab_limit < restrict_vocab:
+        raise ValueError("A memory budget of " + format_bytes(budget_bytes) + " is too small to load "
+                         + str(restrict_vocab) + " rows of each model.")
+
+    # Then use what is left over for more workers.
+    left_over = budget_bytes - base_bytes - clue_giver_bytes - vocab_limit * bytes_per_row
+    num_workers = int(max(1, min(max_workers, left_over // per_worker_bytes)))
+    return {"vocab_limit": int(vocab_limit), "num_workers": num_workers}
@@ -0,0 +1,168 @@
+# Name: model_server.py
+# Authors: Ryan C Hood and Shanjida Khatun
+#
+# Description: This python script contains a small model server.  Loading the embedding models takes far longer than
+# coming up with a clue, so the server loads them once and then keeps them in memory.  Short command line calls
+# connect to it over a Unix socket and get their answer back right away.
+#
+# Start the server:     python model_server.py serve
+# Ask it for a clue:    python model_server.py clue --turn red --red ... --blue ... --assassin ... --civilian ...
+#
+# The client side of this script only uses the standard library, so it starts quickly.  Everything heavy is imported
+# inside serve().
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+
+DEFAULT_SOCKET_PATH = "/tmp/codenames_models.sock"
+
+
+# ====================================================================================================================
+# Server
+# ====================================================================================================================
+
+class ModelRequestHandler(socketserver.StreamRequestHandler):
+    """ Handles one connection.  Each line sent by the client is a JSON request and each line sent back is a JSON
+    response. """
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                response = self.server.handle_request(request)
+            except Exception as error:
+                response = {"error": str(error)}
+            self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+
+class ModelServer(socketserver.UnixStreamServer):
+    """ A Unix socket server that keeps the red, blue and guesser models resident. """
+
+    def __init__(self, socket_path, red_model, blue_model, guesser_model, vocab_tables=None):
+        self.red_model = red_model
+        self.blue_model = blue_model
+        self.guesser_model = guesser_model
+        self.vocab_tables = vocab_tables
+        socketserver.UnixStreamServer.__init__(self, socket_path, ModelRequestHandler)
+
+    def handle_request(self, request):
+        """ Answers one request.  The supported commands are 'ping', 'clue' and 'clues'. """
+        command = request.get("command")
+        if command == "ping":
+            return {"ok": True}
+        if command == "clue":
+            return self.get_clue(request)
+        if command == "clues":
+            return self.get_clues(request)
+        return {"error": "Unknown command: " + str(command)}
+
+    def get_clue(self, request):
+        """ Builds a Codenames game around the board in the request and returns its code word and number. """
+        from Board import Board
+        from Codenames import Codenames
+
+        board_specs = Board.from_state(request.get("board"), request["designations"], request["current_turn"])
+        codenames = Codenames(self.red_model, self.blue_model, self.guesser_model, 'word2vec', 'glove', 'guesser',
+                              board_specs=board_specs)
+        code_word, number = codenames.get_code_word(request.get("used_code_words", []))
+        return {"code_word": code_word, "number": number}
+
+    def get_clues(self, request):
+        """ Answers a list of board states in one go with the batch clue API. """
+        from batch_clues import get_clues
+
+        clues = get_clues(request["board_states"], self.red_model, self.blue_model, self.guesser_model,
+                          num_alternatives=request.get("num_alternatives", 10), vocab_tables=self.vocab_tables)
+        return {"clues": clues}
+
+
+def serve(socket_path=DEFAULT_SOCKET_PATH, guesser_corpus=None):
+    """ Loads the models and then answers requests until the process is stopped. """
+    from play_games import load_models
+    from vocab_tables import VocabTable
+
+    red_model, blue_model, guesser_model = load_models(guesser_corpus)
+    print("Building vocab tables...")
+    vocab_tables = {'red': VocabTable.build(red_model, guesser_model),
+                    'blue': VocabTable.build(blue_model, guesser_model)}
+
+    # A socket file left behind by a server that did not shut down cleanly would stop us from binding.
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    server = ModelServer(socket_path, red_model, blue_model, guesser_model, vocab_tables)
+    print("Model server listening on", socket_path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        for vocab_table in vocab_tables.values():
+            vocab_table.unlink()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+# ====================================================================================================================
+# Client
+# ====================================================================================================================
+
+def send_request(request, socket_path=DEFAULT_SOCKET_PATH):
+    """ Sends one request to a running model server and returns its response. """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        with client.makefile("r", encoding="utf-8") as response_file:
+            response = json.loads(response_file.readline())
+    if "error" in response:
+        raise RuntimeError(response["error"])
+    return response
+
+
+def request_clue(designations, current_turn, used_code_words=(), board=None, socket_path=DEFAULT_SOCKET_PATH):
+    """ Asks a running model server for a clue for the given board.  Returns the code word and the number. """
+    response = send_request({"command": "clue",
+                             "board": board,
+                             "designations": designations,
+                             "current_turn": current_turn,
+                             "used_code_words": list(used_code_words)}, socket_path)
+    return response["code_word"], response["number"]
+
+
+def request_clues(board_states, num_alternatives=10, socket_path=DEFAULT_SOCKET_PATH):
+    """ Asks a running model server for clues for many board states at once.  See batch_clues.py for the format of
+    a board state and of the clues that come back. """
+    response = send_request({"command": "clues",
+                             "board_states": board_states,
+                             "num_alternatives": num_alternatives}, socket_path)
+    return response["clues"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep the Codenames models loaded and answer clue requests.")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH, help="Path of the Unix socket.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Load the models and start the server.")
+    serve_parser.add_argument("--guesser-corpus", default=None, help="Text corpus for the co-occurrence guesser.")
+
+    clue_parser = subparsers.add_parser("clue", help="Ask a running server for a clue.")
+    clue_parser.add_argument("--turn", required=True, choices=["red", "blue"])
+    clue_parser.add_argument("--red", nargs="*", default=[])
+    clue_parser.add_argument("--blue", nargs="*", default=[])
+    clue_parser.add_argument("--assassin", nargs="*", default=[])
+    clue_parser.add_argument("--civilian", nargs="*", default=[])
+    clue_parser.add_argument("--used", nargs="*", default=[], help="Code words that were already given.")
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.socket, args.guesser_corpus)
+    else:
+        designations = {"red": args.red, "blue": args.blue, "assassin": args.assassin, "civilian": args.civilian}
+        code_word, number = request_clue(designations, args.turn, args.used, socket_path=args.socket)
+        print("CODE WORD: ", code_word)
+        print("INTENDED MATCHES: ", number)
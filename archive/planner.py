@@ -0,0 +1,179 @@
+# Name: planner.py
+# Authors: Ryan C Hood and Shanjida Khatun
+#
+# Description: This python script contains the CluePlanner class, a spymaster that plans a sequence of clues instead of
+# picking one clue at a time.  It splits the remaining team words into clusters of words that are similar to each
+# other, finds the best clue for each cluster, and then gives the clues in order.  The plan is kept between turns, and
+# after each guess only the clusters that lost a word (or whose clue was used) are planned again.
+
+import numpy as np
+
+import helper_methods as helper
+from batch_clues import get_clue_giver, top_k_indices
+
+
+class CluePlanner:
+
+    def __init__(self, model, guesser_model, guesser_model_type='guesser', cluster_threshold=0.25, min_margin=0.05,
+                 max_cluster_size=4, assassin_weight=1.5, candidates_per_cluster=50, vocab_table=None):
+        """ cluster_threshold is the average similarity two clusters need to be merged.  A clue for a cluster has to
+        be more similar to every word in the cluster than to any other word on the board by at least min_margin, or
+        the cluster is split.  Similarity to the assassin counts assassin_weight times as much. """
+        self.clue_giver = get_clue_giver(model, guesser_model, guesser_model_type, vocab_table=vocab_table)
+        # The clue giver builds (or reuses) the table when none is given.
+        self.vocab_table = self.clue_giver.vocab_table
+        self.cluster_threshold = cluster_threshold
+        self.min_margin = min_margin
+        self.max_cluster_size = max_cluster_size
+        self.assassin_weight = assassin_weight
+        self.candidates_per_cluster = candidates_per_cluster
+
+        self.board_words = None
+        self.plan = []
+
+    # ------------------------------ Per game set up ----------------------------------------
+
+    def start_game(self, board_words):
+        """ Works out everything that only depends on the board: the similarity of every vocabulary row to every
+        board word (one matrix product), and the pairwise similarity of the board words. """
+        self.board_words = list(board_words)
+        self.board_index = {word: index for index, word in enumerate(self.board_words)}
+
+        board_vectors = self.clue_giver.get_unit_vectors(self.clue_giver.get_word_ids(self.board_words))
+        self.vocab_similarities = self.clue_giver.vocab_vectors @ board_vectors.T
+        self.pairwise_similarities = board_vectors @ board_vectors.T
+
+        # Board words and their plurals can not be clues, the same as in helper_methods.remove_board_words().
+        p = helper.get_inflect_engine()
+        self.excluded_words = set(word.lower() for word in self.board_words)
+        self.excluded_words.update(p.plural(word).lower() for word in self.board_words)
+        self.plan = []
+
+    # ------------------------------ Giving clues -------------------------------------------
+
+    def next_clue(self, board_specs, team, used_code_words):
+        """ Returns the (code word, number) for the next clue in the plan, updating the plan first for whatever was
+        guessed since the last call.  Returns None if no valid clue could be found. """
+        board_words = board_specs.get_board_words()
+        if board_words != self.board_words:
+            self.start_game(board_words)
+
+        other_team = 'blue' if team == 'red' else 'red'
+        designations = board_specs.designations_currently
+        self.update(designations[team], designations[other_team] + designations['civilian'], designations['assassin'],
+                    used_code_words)
+
+        if not self.plan:
+            return None
+        entry = self.plan[0]
+        return entry['code_word'], len(entry['words'])
+
+    def update(self, team_words, other_words, assassin_words, used_code_words):
+        """ Keeps every planned cluster that still has all of its words and an unused clue, and plans the rest of the
+        team words again. """
+        live_words = set(team_words)
+        used_words = set(word.lower() for word in used_code_words)
+        planned_words = set(word for entry in self.plan for word in entry['words'])
+
+        kept_entries = []
+        words_to_plan = [word for word in team_words if word not in planned_words]
+        for entry in self.plan:
+            if all(word in live_words for word in entry['words']) and entry['code_word'] not in used_words:
+                kept_entries.append(entry)
+            else:
+                words_to_plan.extend(word for word in entry['words'] if word in live_words)
+
+        new_entries = []
+        if words_to_plan:
+            new_entries = self.plan_clusters(self.cluster_words(words_to_plan), other_words, assassin_words, used_words)
+
+        # Bigger clusters first, then the clearest clues.
+        self.plan = sorted(kept_entries + new_entries, key=lambda entry: (len(entry['words']), entry['margin']),
+                           reverse=True)
+        return
+
+    # ------------------------------ Clustering ---------------------------------------------
+
+    def cluster_words(self, words):
+        """ Average linkage clustering on the precomputed pairwise similarities.  The two closest clusters are merged
+        until no pair is closer than cluster_threshold or the merge would be too big. """
+        clusters = [[self.board_index[word]] for word in words]
+        while len(clusters) > 1:
+            best_pair, best_similarity = None, self.cluster_threshold
+            for first in range(0, len(clusters)):
+                for second in range(first + 1, len(clusters)):
+                    if len(clusters[first]) + len(clusters[second]) > self.max_cluster_size:
+                        continue
+                    similarity = self.pairwise_similarities[np.ix_(clusters[first], clusters[second])].mean()
+                    if similarity > best_similarity:
+                        best_pair, best_similarity = (first, second), similarity
+            if best_pair is None:
+                break
+            first, second = best_pair
+            clusters[first] = clusters[first] + clusters[second]
+            del clusters[second]
+        return [[self.board_words[index] for index in cluster] for cluster in clusters]
+
+    # ------------------------------ Finding clues ------------------------------------------
+
+    def plan_clusters(self, clusters, other_words, assassin_words, used_words):
+        """ Finds the best clue for every cluster, scoring the whole restricted vocabulary for all of the clusters at
+        once.  A cluster whose best clue is not clear enough loses its least similar word, which is planned on its
+        own. """
+        # The closest non team word to each vocabulary row, with the assassin weighted up.
+        bad_columns = [self.board_index[word] for word in other_words]
+        assassin_columns = [self.board_index[word] for word in assassin_words]
+        num_rows = self.vocab_similarities.shape[0]
+        bad_similarity = np.full(num_rows, -np.inf, dtype=np.float32)
+        if bad_columns:
+            bad_similarity = np.maximum(bad_similarity, self.vocab_similarities[:, bad_columns].max(axis=1))
+        if assassin_columns:
+            bad_similarity = np.maximum(bad_similarity,
+                                        self.assassin_weight * self.vocab_similarities[:, assassin_columns].max(axis=1))
+
+        entries = []
+        while clusters:
+            # A clue is only as good as its match with the weakest word in the cluster.
+            margins = np.stack([self.vocab_similarities[:, [self.board_index[word] for word in cluster]].min(axis=1)
+                                for cluster in clusters]) - bad_similarity
+            candidate_rows = top_k_indices(margins, self.candidates_per_cluster)
+
+            clusters_to_retry = []
+            for cluster_index, cluster in enumerate(clusters):
+                row = self.find_valid_clue(candidate_rows[cluster_index], used_words)
+                if row is None:
+                    continue
+                margin = float(margins[cluster_index, row])
+                if margin < self.min_margin and len(cluster) > 1:
+                    # Split off the word the clue fits worst and try both parts again.
+                    member_similarities = [self.vocab_similarities[row, self.board_index[word]] for word in cluster]
+                    worst_word = cluster[int(np.argmin(member_similarities))]
+                    clusters_to_retry.append([word for word in cluster if word != worst_word])
+                    clusters_to_retry.append([worst_word])
+                    continue
+                entries.append({'code_word': self.clue_giver.model.index_to_key[row].lower(),
+                                'words': list(cluster),
+                                'margin': margin})
+            clusters = clusters_to_retry
+        return entries
+
+    def find_valid_clue(self, candidate_rows, used_words):
+        """ Returns the first vocabulary row that is allowed as a clue, or None.  The checks are the ones
+        helper_methods.full_pipeline() and Codenames.find_best_valid_word() make. """
+        for row in candidate_rows.tolist():
+            if self.vocab_table is not None:
+                record = self.vocab_table.table[row]
+                if not record['is_alpha'] or not record['guesser_valid']:
+                    continue
+                word = self.clue_giver.model.index_to_key[row].lower()
+            else:
+                word = self.clue_giver.model.index_to_key[row]
+                if not word.isalpha():
+                    continue
+                word = word.lower()
+                if not self.clue_giver.is_valid_for_guesser(word):
+                    continue
+            if word in used_words or word in self.excluded_words:
+                continue
+            return row
+        return None
@@ -5,30 +5,47 @@
 #
 
 from Codenames import Codenames
-import gensim
-from gensim.scripts.glove2word2vec import glove2word2vec
-from gensim.models.keyedvectors import KeyedVectors
+from guessers import EmbeddingGuesser, CooccurrenceGuesser
+from game_log import GameLogWriter
+from memory_profile import MemoryAccountant, memory_phase, plan_for_budget
 
+# gensim is only imported inside load_models(), so importing this module (for example from model_server.py) stays
+# cheap until the models are actually needed.
 
-def play_games(num_games, red_model, blue_model, guesser_model):
-    """ This method takes a list of models, a plays a bulk number of games. """
+
+def play_games(num_games, red_model, blue_model, guesser_model, game_log_file=None, seed=None, accountant=None,
+               spymaster_mode='greedy'):
+    """ This method takes a list of models, a plays a bulk number of games.  If a game log file is given, every game is
+    written to it (see game_log.py).  If a seed is given, game i is dealt with seed + i, so the run can be repeated.
+    If a MemoryAccountant is given, the memory of every game and every turn is measured.  The spymaster_mode is passed
+    on to Codenames. """
     # Set up lists to hold final results.
     winners = []
     first_players = []
+    game_log = GameLogWriter(game_log_file) if game_log_file is not None else None
 
     for game_index in range(0, num_games):
         print("Starting to play game", game_index, " out of", num_games)
 
         # Instantiate a game of Codenames
-        codenames = Codenames(red_model, blue_model, guesser_model, 'word2vec', 'glove', 'word2vec')
+        game_seed = seed + game_index if seed is not None else None
+        with memory_phase(accountant, "game setup"):
+            codenames = Codenames(red_model, blue_model, guesser_model, 'word2vec', 'glove', 'guesser', seed=game_seed,
+                                  spymaster_mode=spymaster_mode)
+        if accountant is not None:
+            accountant.record_component("Board", codenames.board_specs)
+            accountant.record_component("Codenames (no models)", codenames,
+                                        exclude=(red_model, blue_model, guesser_model))
 
         # Get info related to the current game.
         first_player = codenames.board_specs.first_player
 
-        winner = codenames.play_full_game()
+        winner = codenames.play_full_game(game_log, accountant)
         first_players.append(first_player)
         winners.append(winner)
 
+    if game_log is not None:
+        game_log.close()
     return winners, first_players
 
 
@@ -58,29 +75,78 @@ def find_basic_statistics(winners, first_players):
     return num_red_wins, num_blue_wins, num_first_player_wins, num_second_player_wins
 
 
-if __name__ == '__main__':
-    NUM_GAMES = 3
-    print("The number of games to be played is: ", NUM_GAMES)
+def get_model_vector_sizes(guesser_corpus=None):
+    """ Returns the dimensions of the embedding models that load_models() loads, for plan_for_budget().  The
+    co-occurrence guesser is sparse and its size does not depend on the vocabulary limit, so it is left out when a
+    corpus is given. """
+    if guesser_corpus is not None:
+        return (300, 100)
+    return (300, 100, 300)
+
+
+def load_models(guesser_corpus=None, limit=500000, accountant=None):
+    """ This method loads the red, blue and guesser models from disk, keeping the first (limit) rows of each.  If a
+    local text corpus is given, the guesser is a co-occurrence model built from it.  Otherwise the guesser is the
+    fastText embedding model wrapped in the batched guesser interface.  If a MemoryAccountant is given, the size of
+    each model is recorded. """
+    from gensim.models.keyedvectors import KeyedVectors
 
     # RED MODEL
     print("Loading in red team's model...")
-    RED_MODEL = gensim.models.KeyedVectors.load_word2vec_format('GoogleNews-vectors-negative300.bin.gz', binary=True, limit=500000)
+    with memory_phase(accountant, "load red model", take_snapshots=True):
+        red_model = KeyedVectors.load_word2vec_format('GoogleNews-vectors-negative300.bin.gz', binary=True, limit=limit)
 
     # BLUE MODEL
     print("Loading in blue team's model...")
+    #from gensim.scripts.glove2word2vec import glove2word2vec
     #glove2word2vec(glove_input_file="glove.6B.100d.txt", word2vec_output_file="glove_100d_as_word2vec.txt")
-    BLUE_MODEL = KeyedVectors.load_word2vec_format("glove_100d_as_word2vec.txt", binary=False, limit=500000)
+    with memory_phase(accountant, "load blue model", take_snapshots=True):
+        blue_model = KeyedVectors.load_word2vec_format("glove_100d_as_word2vec.txt", binary=False, limit=limit)
 
     # GUESSER MODEL
     print("Loading in guesser model...")
-    # TO DO: Change this to effectively load in a guesser model that is not word2vec or glove.  Right now it is word2vec.
-    GUESSER_MODEL = gensim.models.KeyedVectors.load_word2vec_format('wiki-news-300d-1M.vec', binary=False, limit=500000)
+    with memory_phase(accountant, "load guesser model", take_snapshots=True):
+        if guesser_corpus is not None:
+            guesser_model = CooccurrenceGuesser.from_corpus_file(guesser_corpus)
+        else:
+            guesser_model = EmbeddingGuesser(KeyedVectors.load_word2vec_format('wiki-news-300d-1M.vec', binary=False, limit=limit))
+
+    if accountant is not None:
+        accountant.record_component("red model", red_model)
+        accountant.record_component("blue model", blue_model)
+        accountant.record_component("guesser model", guesser_model)
 
     print("Finished Loading in models.")
+    return red_model, blue_model, guesser_model
 
 
+if __name__ == '__main__':
+    NUM_GAMES = 3
+    # Set this to the path of a local text corpus to use the co-occurrence guesser.
+    GUESSER_CORPUS = None
+    # Set this to a file name to log every game so it can be replayed with replay.py.
+    GAME_LOG_FILE = None
+    SEED = None
+    # Set MEMORY_REPORT to print the memory used by the models, the games and the turns.  Set MEMORY_BUDGET to a number
+    # of GB to cut the model vocabularies down until everything fits.
+    MEMORY_REPORT = False
+    MEMORY_BUDGET = None
+    # Set this to 'planner' to have the spymasters plan a sequence of clues instead of one clue at a time.
+    SPYMASTER_MODE = 'greedy'
+    print("The number of games to be played is: ", NUM_GAMES)
+
+    ACCOUNTANT = MemoryAccountant() if MEMORY_REPORT else None
+    VOCAB_LIMIT = 500000
+    if MEMORY_BUDGET is not None:
+        VOCAB_LIMIT = plan_for_budget(int(MEMORY_BUDGET * 1024 ** 3), get_model_vector_sizes(GUESSER_CORPUS),
+                                      max_workers=1)["vocab_limit"]
+        print("Vocabulary limit for the memory budget: ", VOCAB_LIMIT)
+
+    RED_MODEL, BLUE_MODEL, GUESSER_MODEL = load_models(GUESSER_CORPUS, VOCAB_LIMIT, ACCOUNTANT)
+
     print("Beginning to play games.")
-    winners, first_players = play_games(NUM_GAMES, RED_MODEL, BLUE_MODEL, GUESSER_MODEL)
+    winners, first_players = play_games(NUM_GAMES, RED_MODEL, BLUE_MODEL, GUESSER_MODEL, GAME_LOG_FILE, SEED, ACCOUNTANT,
+                                       SPYMASTER_MODE)
     print("Games finished!")
     num_red_wins, num_blue_wins, num_first_player_wins, num_second_player_wins = find_basic_statistics(winners, first_players)
 
@@ -89,4 +155,5 @@ if __name__ == '__main__':
     print("NUM FIRST PLAYER WINS: ", num_first_player_wins)
     print("NUM SECOND PLAYER WINS: ", num_second_player_wins)
 
-
+    if ACCOUNTANT is not None:
+        ACCOUNTANT.print_report()
@@ -0,0 +1,141 @@
+# Name: replay.py
+# Authors: Ryan C Hood and Shanjida Khatun
+#
+# Description: This python script contains the replay engine.  It reads a game log (see game_log.py), rebuilds the
+# board state before every turn, and computes the clue for each of them again with the batch clue API.  Guessing is
+# not replayed, only clue generation.  Any turn where the new clue is not the logged clue is reported, which lets us
+# check that a change to the clue code leaves the clues alone over thousands of games.  Only games played with the
+# greedy spymaster can be replayed, since the planner's clues depend on the plan it kept from the earlier turns.
+#
+# Usage:    python replay.py game_log.jsonl --workers 4
+
+import argparse
+import multiprocessing
+
+from batch_clues import get_clues, get_clue_giver
+from game_log import read_game_log, get_turn_states
+from memory_profile import MemoryAccountant, memory_phase, plan_for_budget
+from vocab_tables import VocabTable
+
+# The models are set here before the worker pool is started, so forked workers share them with the parent process
+# instead of each loading or unpickling their own copy.
+replay_models = {}
+
+
+def attach_vocab_tables(attach_args):
+    """ Runs once in each worker.  Attaches to the shared memory vocab tables by name, and points the clue givers
+    that were built before the fork at this process's own attachment. """
+    vocab_tables = {}
+    for team, (shared_memory_name, num_rows) in attach_args.items():
+        vocab_tables[team] = VocabTable.attach(replay_models[team], shared_memory_name, num_rows)
+        clue_giver = get_clue_giver(replay_models[team], replay_models["guesser"], replay_models["guesser_type"],
+                                    vocab_table=vocab_tables[team])
+        clue_giver.vocab_table = vocab_tables[team]
+    replay_models["vocab_tables"] = vocab_tables
+
+
+def replay_chunk(board_states):
+    """ Computes the clues for one chunk of board states.  This runs in the worker processes. """
+    return get_clues(board_states, replay_models["red"], replay_models["blue"], replay_models["guesser"],
+                     replay_models["guesser_type"], batch_size=len(board_states) or 1,
+                     vocab_tables=replay_models["vocab_tables"], use_vocab_tables=replay_models["use_vocab_tables"])
+
+
+def replay_games(games, red_model, blue_model, guesser_model, guesser_model_type='guesser', num_workers=4,
+                 chunk_size=256, vocab_tables=None, use_vocab_tables=True, accountant=None):
+    """ Replays the clue generation of every turn of every game.  Returns the number of turns replayed and a list of
+    mismatches.  Each mismatch is a dict with the game index, the turn index, the logged clue and the new clue.  If a
+    MemoryAccountant is given, the memory of the main process is measured (the workers are not traced).  Games that
+    were not played with the greedy spymaster are skipped.  vocab_tables and use_vocab_tables are passed on to
+    get_clues(). """
+    skipped_games = [game for game in games if game.get("spymaster_mode", "greedy") != "greedy"]
+    if skipped_games:
+        print("Skipping", len(skipped_games), "games that were not played with the greedy spymaster.")
+
+    turn_records = []
+    for game_index, game in enumerate(games):
+        if game.get("spymaster_mode", "greedy") != "greedy":
+            continue
+        for turn_index, (board_state, turn) in enumerate(get_turn_states(game)):
+            turn_records.append((game_index, turn_index, board_state, turn))
+
+    board_states = [record[2] for record in turn_records]
+    chunks = [board_states[start:start + chunk_size] for start in range(0, len(board_states), chunk_size)]
+
+    replay_models.update({"red": red_model, "blue": blue_model, "guesser": guesser_model,
+                          "guesser_type": guesser_model_type, "vocab_tables": vocab_tables,
+                          "use_vocab_tables": use_vocab_tables})
+    # Build the clue givers now, so the normalized vocabularies are made once and shared by the forked workers.
+    with memory_phase(accountant, "build clue givers", take_snapshots=True):
+        for team, model in [('red', red_model), ('blue', blue_model)]:
+            get_clue_giver(model, guesser_model, guesser_model_type, vocab_table=(vocab_tables or {}).get(team),
+                           use_vocab_table=use_vocab_tables)
+    with memory_phase(accountant, "replay"):
+        if num_workers > 1 and len(chunks) > 1:
+            attach_args = {team: vocab_table.get_attach_args() for team, vocab_table in (vocab_tables or {}).items()}
+            with multiprocessing.get_context("fork").Pool(num_workers, initializer=attach_vocab_tables,
+                                                          initargs=(attach_args,)) as pool:
+                chunk_clues = pool.map(replay_chunk, chunks)
+        else:
+            chunk_clues = [replay_chunk(chunk) for chunk in chunks]
+    clues = [clue for chunk in chunk_clues for clue in chunk]
+
+    mismatches = []
+    for (game_index, turn_index, board_state, turn), clue in zip(turn_records, clues):
+        if clue["code_word"] != turn["code_word"] or clue["number"] != turn["number"]:
+            mismatches.append({"game": game_index,
+                               "turn": turn_index,
+                               "logged": (turn["code_word"], turn["number"]),
+                               "replayed": (clue["code_word"], clue["number"])})
+    return len(turn_records), mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay the clue generation of logged Codenames games.")
+    parser.add_argument("game_log", help="A JSONL game log written by play_games.py.")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--guesser-corpus", default=None, help="Text corpus for the co-occurrence guesser.")
+    parser.add_argument("--no-vocab-tables", action="store_true",
+                        help="Filter candidates with the string pipeline instead of the shared memory vocab tables.")
+    parser.add_argument("--memory-report", action="store_true", help="Print the memory used by each component.")
+    parser.add_argument("--memory-budget", type=float, default=None,
+                        help="Memory budget in GB.  The vocabulary limit and the number of workers are picked to fit.")
+    args = parser.parse_args()
+
+    from play_games import load_models, get_model_vector_sizes
+
+    ACCOUNTANT = MemoryAccountant() if args.memory_report else None
+    NUM_WORKERS = args.workers
+    VOCAB_LIMIT = 500000
+    if args.memory_budget is not None:
+        PLAN = plan_for_budget(int(args.memory_budget * 1024 ** 3), get_model_vector_sizes(args.guesser_corpus),
+                               chunk_size=args.chunk_size, max_workers=args.workers)
+        NUM_WORKERS, VOCAB_LIMIT = PLAN["num_workers"], PLAN["vocab_limit"]
+        print("Memory budget plan: ", NUM_WORKERS, "workers, vocabulary limit", VOCAB_LIMIT)
+
+    GAMES = read_game_log(args.game_log)
+    print("Replaying", len(GAMES), "games.")
+    RED_MODEL, BLUE_MODEL, GUESSER_MODEL = load_models(args.guesser_corpus, VOCAB_LIMIT, ACCOUNTANT)
+
+    VOCAB_TABLES = None
+    if not args.no_vocab_tables:
+        print("Building vocab tables...")
+        VOCAB_TABLES = {'red': VocabTable.build(RED_MODEL, GUESSER_MODEL),
+                        'blue': VocabTable.build(BLUE_MODEL, GUESSER_MODEL)}
+
+    try:
+        NUM_TURNS, MISMATCHES = replay_games(GAMES, RED_MODEL, BLUE_MODEL, GUESSER_MODEL, num_workers=NUM_WORKERS,
+                                             chunk_size=args.chunk_size, vocab_tables=VOCAB_TABLES,
+                                             use_vocab_tables=not args.no_vocab_tables, accountant=ACCOUNTANT)
+    finally:
+        for VOCAB_TABLE in (VOCAB_TABLES or {}).values():
+            VOCAB_TABLE.unlink()
+    for mismatch in MISMATCHES:
+        print("GAME", mismatch["game"], "TURN", mismatch["turn"], "LOGGED:", mismatch["logged"],
+              "REPLAYED:", mismatch["replayed"])
+    print("TURNS REPLAYED: ", NUM_TURNS)
+    print("MISMATCHES: ", len(MISMATCHES))
+
+    if ACCOUNTANT is not None:
+        ACCOUNTANT.print_report()
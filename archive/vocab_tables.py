@@ -0,0 +1,304 @@
+# Name: vocab_tables.py
+# Authors: Ryan C Hood and Shanjida Khatun
+#
+# Description: This python script contains the VocabTable class.  Every check in helper_methods.full_pipeline (is the
+# word alphabetical, what is its lowercase form, which words are plural copies of each other, can the guesser
+# interpret it) only depends on the word itself, so for the restricted vocabulary of a model we can work all of them
+# out once.  The answers are stored in a numpy array that lives in shared memory, so every worker process can use
+# the same table, and filtering a list of candidate rows becomes a few boolean mask operations.
+#
+# Running this script checks that filter_candidates() gives the same words as helper_methods.full_pipeline() on
+# random candidate lists.  It should be run after any change to the pipeline.
+#
+# Usage:    python vocab_tables.py --trials 500
+#           python vocab_tables.py --model GoogleNews-vectors-negative300.bin.gz --binary --limit 500000
+
+import argparse
+import atexit
+import os
+import random
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import helper_methods as helper
+
+# One record per vocabulary row.
+#   is_alpha:        the word only contains letters (keep_single_words).
+#   canonical_id:    the first row whose lowercase form is the same as this row's (set_lowercase, remove_repeats).
+#   plural_id:       the canonical row of the inflect plural of the lowercase word, or -1 (remove_plural_copies).
+#   guesser_valid:   the guesser model can interpret the lowercase word (find_best_valid_word).
+TABLE_DTYPE = np.dtype([('is_alpha', np.bool_),
+                        ('canonical_id', np.int32),
+                        ('plural_id', np.int32),
+                        ('guesser_valid', np.bool_)])
+
+
+class VocabTable:
+
+    def __init__(self, model, shared_memory_block, num_rows, owner, board_words_file="words.txt"):
+        """ Use VocabTable.build() or VocabTable.attach() rather than calling this directly. """
+        self.model = model
+        self.shared_memory_block = shared_memory_block
+        self.num_rows = num_rows
+        self.owner = owner
+        # Forked workers inherit the owner's object, so only the process that built the table may free it.
+        self.owner_pid = os.getpid() if owner else None
+        self.table = np.ndarray((num_rows,), dtype=TABLE_DTYPE, buffer=shared_memory_block.buf)
+
+        # The lowercase word -> canonical row dict lets us find the rows of words that come from outside the
+        # vocabulary (board words, used code words).  It is cheap to rebuild in each process from the model.
+        self.lowercase_to_canonical = {}
+        for index in range(0, num_rows):
+            self.lowercase_to_canonical.setdefault(model.index_to_key[index].lower(), index)
+
+        # Board word -> canonical rows of the word and of its plural (remove_board_words).  Every card word is worked
+        # out here, so inflect is not called again for each board.  Board words that are not in the file (from OCR,
+        # for example) are worked out the first time they are seen and then kept.
+        self.board_word_ids = {}
+        if board_words_file is not None and os.path.exists(board_words_file):
+            with open(board_words_file) as word_file:
+                for word in word_file:
+                    self.get_board_word_ids(word.strip().lower())
+
+    @classmethod
+    def build(cls, model, guesser_model, guesser_model_type='guesser', restrict_vocab=50000):
+        """ Works out the table for the first restrict_vocab rows of the model and puts it in a new shared memory
+        block.  The process that builds the table owns it and should call unlink() when it is done. """
+        num_rows = min(restrict_vocab, len(model.index_to_key))
+        shared_memory_block = shared_memory.SharedMemory(create=True, size=max(num_rows * TABLE_DTYPE.itemsize, 1))
+        vocab_table = cls(model, shared_memory_block, num_rows, owner=True)
+        table = vocab_table.table
+        words = model.index_to_key[:num_rows]
+
+        # STEP 1: Alphabetical flags and lowercase canonical rows.
+        table['is_alpha'] = [word.isalpha() for word in words]
+        table['canonical_id'] = [vocab_table.lowercase_to_canonical[word.lower()] for word in words]
+
+        # STEP 2: The canonical row of the plural of every lowercase word.  A word like "fish" is its own plural.
+        p = helper.get_inflect_engine()
+        plural_ids = {}
+        for lowercase_word, index in vocab_table.lowercase_to_canonical.items():
+            if lowercase_word.isalpha():
+                plural_ids[index] = vocab_table.lowercase_to_canonical.get(p.plural(lowercase_word), -1)
+        table['plural_id'] = [plural_ids.get(canonical_id, -1) for canonical_id in table['canonical_id']]
+
+        # STEP 3: Guesser flags.  The pipeline lowercases candidates before the guesser sees them.
+        if guesser_model_type == 'guesser':
+            table['guesser_valid'] = [guesser_model.is_valid_word(word.lower()) for word in words]
+        else:
+            table['guesser_valid'] = [word.lower() in guesser_model.key_to_index for word in words]
+
+        return vocab_table
+
+    @classmethod
+    def attach(cls, model, shared_memory_name, num_rows):
+        """ Attaches to a table that another process built.  The model must be the same one the table was built
+        from. """
+        shared_memory_block = shared_memory.SharedMemory(name=shared_memory_name)
+        return cls(model, shared_memory_block, num_rows, owner=False)
+
+    def get_attach_args(self):
+        """ Returns the (shared memory name, number of rows) that another process passes to attach(). """
+        return self.name, self.num_rows
+
+    @property
+    def name(self):
+        """ The name of the shared memory block, which is what attach() needs. """
+        return self.shared_memory_block.name
+
+    def close(self):
+        """ Detaches this process from the shared memory. """
+        self.table = None
+        self.shared_memory_block.close()
+
+    def unlink(self):
+        """ Frees the shared memory.  Only the process that built the table should call this. """
+        self.close()
+        if self.owner and self.owner_pid == os.getpid():
+            self.shared_memory_block.unlink()
+
+    # ------------------------------ Lookups ------------------------------------------------
+
+    def get_canonical_ids(self, words):
+        """ Returns the canonical row of each word, or -1 if it is not in the table.  Words are matched exactly, the
+        same way the pipeline compares them against its lowercased candidates. """
+        return np.array([self.lowercase_to_canonical.get(word, -1) for word in words], dtype=np.int64)
+
+    def get_board_word_ids(self, board_word):
+        """ Returns the canonical rows of a board word and of its plural, which can not be used as a code word. """
+        if board_word not in self.board_word_ids:
+            p = helper.get_inflect_engine()
+            ids = self.get_canonical_ids([board_word, p.plural(board_word)])
+            self.board_word_ids[board_word] = ids[ids >= 0]
+        return self.board_word_ids[board_word]
+
+    def get_board_ids(self, board_words):
+        """ Returns the canonical rows of all of the board words and their plurals. """
+        if not board_words:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([self.get_board_word_ids(word) for word in board_words])
+
+    # ------------------------------ Filtering ----------------------------------------------
+
+    def filter_candidates(self, candidate_ids, used_ids, board_ids, bad_ids):
+        """ The mask version of remove_used_code_words followed by full_pipeline.  candidate_ids and bad_ids are rows
+        in similarity order.  used_ids are the canonical rows of the used code words and board_ids are the ones from
+        get_board_ids().  Returns the canonical rows of the candidates that survive, still in similarity order. """
+        table = self.table
+        candidate_records = table[candidate_ids]
+        bad_records = table[bad_ids]
+
+        # The bad set only goes through remove_used_code_words, keep_single_words and the lowercasing before it is
+        # used.
+        bad_keep = bad_records['is_alpha'] & ~np.isin(bad_records['canonical_id'], used_ids)
+        bad_canonical_ids = bad_records['canonical_id'][bad_keep]
+
+        # remove_used_code_words and keep_single_words.
+        canonical_ids = candidate_records['canonical_id']
+        keep = candidate_records['is_alpha'] & ~np.isin(canonical_ids, used_ids)
+
+        # set_lowercase and remove_repeats: keep the first kept row of each lowercase word.
+        same_word = (canonical_ids[:, None] == canonical_ids[None, :]) & keep[None, :]
+        earlier = np.tri(len(canonical_ids), k=-1, dtype=bool)
+        keep &= ~(same_word & earlier).any(axis=1)
+        canonical_ids = canonical_ids[keep]
+        plural_ids = candidate_records['plural_id'][keep]
+
+        # remove_plural_copies.  Going through the words in order, a word that has not been removed yet removes the
+        # word that is its plural, wherever it is in the list (itself included, for words like "fish").  The matches
+        # are one mask, and only the order dependent part is a loop over small integers.
+        plural_matches = plural_ids[:, None] == canonical_ids[None, :]
+        plural_positions = np.where(plural_matches.any(axis=1), plural_matches.argmax(axis=1), -1).tolist()
+        removed = [False] * len(canonical_ids)
+        for position, plural_position in enumerate(plural_positions):
+            if not removed[position] and plural_position >= 0:
+                removed[plural_position] = True
+        keep = ~np.array(removed, dtype=bool)
+
+        # remove_board_words and remove_bad_words.
+        keep &= ~np.isin(canonical_ids, board_ids)
+        keep &= ~np.isin(canonical_ids, bad_canonical_ids)
+        return canonical_ids[keep]
+
+
+# ====================================================================================================================
+# Cached tables
+# ====================================================================================================================
+
+# Tables are expensive to build, so we keep one per (model, guesser) pair.  The ones built here are freed when the
+# process that built them exits.
+vocab_table_cache = {}
+
+
+def get_vocab_table(model, guesser_model, guesser_model_type='guesser', restrict_vocab=50000):
+    """ Returns the cached VocabTable for the model, building it the first time. """
+    key = (id(model), id(guesser_model), guesser_model_type, restrict_vocab)
+    if key not in vocab_table_cache:
+        vocab_table_cache[key] = VocabTable.build(model, guesser_model, guesser_model_type, restrict_vocab)
+    return vocab_table_cache[key]
+
+
+def unlink_cached_tables():
+    """ Frees the tables built by get_vocab_table().  This runs when the process exits. """
+    for vocab_table in vocab_table_cache.values():
+        if vocab_table.table is not None:
+            vocab_table.unlink()
+    vocab_table_cache.clear()
+
+
+atexit.register(unlink_cached_tables)
+
+
+# ====================================================================================================================
+# Checking the table against the pipeline
+# ====================================================================================================================
+
+def check_filter_candidates(vocab_table, num_trials=500, seed=0, board_words_file="words.txt"):
+    """ Filters random candidate lists with filter_candidates() and with remove_used_code_words() and full_pipeline(),
+    and returns the number of lists where the words that survive are not the same.  Half of each list comes from the
+    rows the tricky steps act on (case copies and words with a plural in the vocabulary). """
+    model = vocab_table.model
+    table = vocab_table.table
+    rng = random.Random(seed)
+    with open(board_words_file) as word_file:
+        board_words = [word.strip().lower() for word in word_file if word.strip()]
+
+    all_rows = list(range(0, vocab_table.num_rows))
+    tricky_rows = [row for row in all_rows if table['canonical_id'][row] != row or table['plural_id'][row] >= 0]
+    tricky_rows = tricky_rows or all_rows
+
+    num_mismatches = 0
+    for trial in range(0, num_trials):
+        candidate_ids = (rng.sample(all_rows, min(50, len(all_rows)))
+                         + rng.sample(tricky_rows, min(50, len(tricky_rows))))
+        rng.shuffle(candidate_ids)
+        bad_ids = rng.sample(all_rows, min(30, len(all_rows)))
+        used_code_words = [model.index_to_key[row].lower() for row in rng.sample(tricky_rows, min(3, len(tricky_rows)))]
+        board = rng.sample(board_words, min(25, len(board_words)))
+
+        result_set = [(model.index_to_key[row], 0.0) for row in candidate_ids]
+        bad_set = [(model.index_to_key[row], 0.0) for row in bad_ids]
+        result_set = helper.remove_used_code_words(result_set, used_code_words)
+        bad_set = helper.remove_used_code_words(bad_set, used_code_words)
+        expected = [tup[0] for tup in helper.full_pipeline(board, result_set, bad_set)]
+
+        used_ids = vocab_table.get_canonical_ids(used_code_words)
+        kept_ids = vocab_table.filter_candidates(np.array(candidate_ids), used_ids, vocab_table.get_board_ids(board),
+                                                 np.array(bad_ids))
+        found = [model.index_to_key[row].lower() for row in kept_ids.tolist()]
+
+        if found != expected:
+            num_mismatches = num_mismatches + 1
+            if num_mismatches <= 5:
+                print("MISMATCH in trial", trial)
+                print("  pipeline: ", expected)
+                print("  table:    ", found)
+    return num_mismatches
+
+
+def make_test_model(board_words_file="words.txt", vector_size=16, seed=0):
+    """ Makes a small model with random vectors whose vocabulary has the cases the pipeline has to deal with: the card
+    words, their plurals, upper and title case copies, words that are their own plural, and words with other
+    characters. """
+    from gensim.models.keyedvectors import KeyedVectors
+
+    p = helper.get_inflect_engine()
+    with open(board_words_file) as word_file:
+        board_words = [word.strip().lower() for word in word_file if word.strip()]
+    words = board_words + [p.plural(word) for word in board_words]
+    words = words + [word.upper() for word in words[::7]] + [word.title() for word in words[::5]]
+    words = words + ["fish", "sheep", "deer", "series", "news", "high_five", "v8", "u.s."]
+    words = list(dict.fromkeys(words))
+    random.Random(seed).shuffle(words)
+
+    model = KeyedVectors(vector_size=vector_size)
+    model.add_vectors(words, np.random.default_rng(seed).standard_normal((len(words), vector_size)).astype(np.float32))
+    return model
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check the vocab table filter against helper_methods.full_pipeline().")
+    parser.add_argument("--model", default=None,
+                        help="A model in word2vec format.  Without one, a small model with random vectors is used.")
+    parser.add_argument("--binary", action="store_true", help="The model file is in the binary word2vec format.")
+    parser.add_argument("--limit", type=int, default=500000)
+    parser.add_argument("--trials", type=int, default=500)
+    args = parser.parse_args()
+
+    from guessers import EmbeddingGuesser
+
+    if args.model is not None:
+        from gensim.models.keyedvectors import KeyedVectors
+        MODEL = KeyedVectors.load_word2vec_format(args.model, binary=args.binary, limit=args.limit)
+    else:
+        MODEL = make_test_model()
+
+    VOCAB_TABLE = VocabTable.build(MODEL, EmbeddingGuesser(MODEL))
+    try:
+        NUM_MISMATCHES = check_filter_candidates(VOCAB_TABLE, args.trials)
+    finally:
+        VOCAB_TABLE.unlink()
+    print("MISMATCHES: ", NUM_MISMATCHES, "of", args.trials)
+    if NUM_MISMATCHES:
+        raise SystemExit(1)
@@ -1,4 +1,16 @@
-import easyocr
+# easyocr (and torch underneath it) is only imported when a reader is created, so importing this module is cheap.
+# The same goes for cv2, which comes with easyocr.
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def create_reader(languages=('en',)):
+    """ Creates the easyocr reader.  This is the slow step, so it should be done once and the reader reused. """
+    import easyocr
+    return easyocr.Reader(list(languages))
 
 
 def perform_ocr(ocr_reader, img_path):
@@ -30,10 +42,280 @@ def filter_words(ocr_results, valid_words_file_path):
 
 
 
-if __name__ == "__main__":
-    reader = easyocr.Reader(['en']) 
-    result = perform_ocr(reader, '../codenames_ai/imgs/codenames_board_2.jpg')
-    
+# ====================================================================================================================
+# Word index
+# ====================================================================================================================
+
+def edit_distance(first_word, second_word):
+    """ The Levenshtein distance between two words. """
+    previous_row = list(range(0, len(second_word) + 1))
+    for first_index, first_char in enumerate(first_word, 1):
+        current_row = [first_index]
+        for second_index, second_char in enumerate(second_word, 1):
+            current_row.append(min(previous_row[second_index] + 1,
+                                   current_row[second_index - 1] + 1,
+                                   previous_row[second_index - 1] + (first_char != second_char)))
+        previous_row = current_row
+    return previous_row[-1]
+
+
+class WordIndex:
+    """ A BK-tree over the valid card words.  It finds the closest valid word to a misread word without comparing it
+    against the whole word list.  The separate words of a two word card (ICE and CREAM from ICE CREAM) are in the
+    tree too, since the reader often finds them as two boxes, and they lead back to the whole card word. """
+
+    def __init__(self, valid_words_file_path):
+        with open(valid_words_file_path) as valid_words_file:
+            self.valid_words = [word.strip() for word in valid_words_file.read().splitlines() if word.strip()]
+
+        # Text in the tree -> the card word it stands for.  A piece that is also a card word on its own stays that
+        # card word.
+        self.card_words = {word: word for word in self.valid_words}
+        for word in self.valid_words:
+            for piece in word.split():
+                self.card_words.setdefault(piece, word)
+
+        # Each node is (text, {distance: child node}).
+        self.root = None
+        for text in self.card_words:
+            self.add(text)
+
+    def add(self, word):
+        if self.root is None:
+            self.root = (word, {})
+            return
+        node = self.root
+        while True:
+            distance = edit_distance(word, node[0])
+            if distance == 0:
+                return
+            if distance not in node[1]:
+                node[1][distance] = (word, {})
+                return
+            node = node[1][distance]
+
+    def closest(self, word, max_distance):
+        """ Returns (valid_word, distance) for the card word whose text (or piece of text) is closest to the word,
+        within max_distance, or (None, None). """
+        if word in self.card_words:
+            return self.card_words[word], 0
+
+        best_word, best_distance = None, None
+        nodes_to_visit = [self.root] if self.root is not None else []
+        while nodes_to_visit:
+            node = nodes_to_visit.pop()
+            distance = edit_distance(word, node[0])
+            if distance <= max_distance and (best_distance is None or distance < best_distance):
+                best_word, best_distance = node[0], distance
+            # By the triangle inequality, only children in this range can be within max_distance.
+            for child_distance, child in node[1].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    nodes_to_visit.append(child)
+        if best_word is None:
+            return None, None
+        return self.card_words[best_word], best_distance
+
+
+# ====================================================================================================================
+# OCR engine
+# ====================================================================================================================
+
+class OcrEngine:
+    """ Reads Codenames boards from photos.
+
+    - Results are cached by a hash of the image file (and the detection settings), in memory and on disk.
+    - Text is detected on a downscaled copy of the image, and only those regions are recognized, in batches, at full
+      resolution.
+    - Text is fuzzy matched against the valid words with a BK-tree, so low confidence reads still land on a real card
+      word, and text that matches no card word is thrown away.
+    - The remaining bounding boxes are clustered into a board_size x board_size grid, and each cell takes its best
+      matching text. """
+
+    def __init__(self, valid_words_file_path, reader=None, cache_dir=".ocr_cache", board_size=5, detect_scale=0.5,
+                 batch_size=16):
+        self.word_index = WordIndex(valid_words_file_path)
+        self.reader = reader
+        self.cache_dir = cache_dir
+        self.board_size = board_size
+        self.detect_scale = detect_scale
+        self.batch_size = batch_size
+
+        self.memory_cache = {}
+        # The easyocr reader is not safe to share between threads, so the model calls take turns.
+        self.reader_lock = threading.Lock()
+
+    # ------------------------------ Caching ------------------------------------------------
+
+    def get_cache_key(self, image_hash):
+        """ The records depend on the detection scale and the batch size as well as the image, so both are part of
+        the key. """
+        return "{}_{}_{}".format(image_hash, self.detect_scale, self.batch_size)
+
+    def get_cache_path(self, image_hash):
+        return os.path.join(self.cache_dir, self.get_cache_key(image_hash) + ".json")
+
+    def load_cached_records(self, image_hash):
+        """ Returns the cached OCR records for an image hash, or None if the image has not been read before. """
+        if self.get_cache_key(image_hash) in self.memory_cache:
+            return self.memory_cache[self.get_cache_key(image_hash)]
+        if self.cache_dir is not None and os.path.exists(self.get_cache_path(image_hash)):
+            with open(self.get_cache_path(image_hash)) as cache_file:
+                records = [(record[0], record[1], record[2]) for record in json.load(cache_file)]
+            self.memory_cache[self.get_cache_key(image_hash)] = records
+            return records
+        return None
+
+    def save_cached_records(self, image_hash, records):
+        self.memory_cache[self.get_cache_key(image_hash)] = records
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self.get_cache_path(image_hash), "w") as cache_file:
+                json.dump(records, cache_file)
 
-    final_words = filter_words(result, "../codenames_ai/words.txt")
-    print(final_words)
\ No newline at end of file
+    # ------------------------------ Detection and recognition ------------------------------
+
+    def run_ocr(self, image_bytes):
+        """ Runs the downscaled detection pass and then the batched recognition pass.  Returns a list of
+        (bbox, text, confidence) records, where bbox is [x_min, x_max, y_min, y_max] in full resolution pixels. """
+        import cv2
+        import numpy as np
+
+        image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        grey_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        small_image = cv2.resize(image, None, fx=self.detect_scale, fy=self.detect_scale, interpolation=cv2.INTER_AREA)
+
+        with self.reader_lock:
+            if self.reader is None:
+                self.reader = create_reader()
+            horizontal_list, free_list = self.reader.detect(small_image)
+
+            # Scale the boxes back up to the full image.  Card words are printed straight, so we only keep the
+            # horizontal boxes.
+            boxes = [[int(coordinate / self.detect_scale) for coordinate in box] for box in horizontal_list[0]]
+            if not boxes:
+                return []
+            results = self.reader.recognize(grey_image, horizontal_list=boxes, free_list=[],
+                                            batch_size=self.batch_size)
+
+        records = []
+        for bbox, text, confidence in results:
+            xs = [int(point[0]) for point in bbox]
+            ys = [int(point[1]) for point in bbox]
+            records.append(([min(xs), max(xs), min(ys), max(ys)], text, float(confidence)))
+        return records
+
+    def get_records(self, img_path):
+        """ Returns the OCR records for an image, from the cache when we have seen the same image before. """
+        with open(img_path, "rb") as image_file:
+            image_bytes = image_file.read()
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
+
+        records = self.load_cached_records(image_hash)
+        if records is None:
+            records = self.run_ocr(image_bytes)
+            self.save_cached_records(image_hash, records)
+        return records
+
+    # ------------------------------ Grid assignment ----------------------------------------
+
+    def cluster_positions(self, positions, min_gap=0):
+        """ Splits 1D positions into groups at the gaps between cards, and returns the grid index (0 to board_size - 1)
+        of each position.  A gap only splits groups if it is at least min_gap and at least half of the card spacing
+        the positions span, so a row or column that could not be read is left empty instead of a real one being split
+        in two.  The grid index of a group comes from its distance to the first group.  If a row or column at the
+        edge is missing, we can not tell which edge it was, so the groups are put against the first edge. """
+        if not positions:
+            return []
+        order = sorted(range(0, len(positions)), key=lambda index: positions[index])
+        span = positions[order[-1]] - positions[order[0]]
+        min_gap = max(min_gap, 0.5 * span / max(self.board_size - 1, 1))
+        gaps = [(positions[order[index + 1]] - positions[order[index]], index) for index in range(0, len(order) - 1)]
+        gaps = [(gap, index) for gap, index in gaps if gap > 0 and gap >= min_gap]
+        split_after = sorted(index for _, index in sorted(gaps, reverse=True)[:self.board_size - 1])
+
+        groups = [0] * len(positions)
+        group = 0
+        for rank, index in enumerate(order):
+            groups[index] = group
+            if group < len(split_after) and rank == split_after[group]:
+                group = group + 1
+
+        num_groups = len(split_after) + 1
+        if num_groups == self.board_size or num_groups == 1:
+            return groups
+
+        # Fewer groups than the board has rows or columns, so each group is placed by the spacing between the groups.
+        group_positions = [[] for _ in range(0, num_groups)]
+        for index, group in enumerate(groups):
+            group_positions[group].append(positions[index])
+        centers = [sum(group_position) / len(group_position) for group_position in group_positions]
+        spacing = min(centers[group + 1] - centers[group] for group in range(0, num_groups - 1))
+        grid_indices = [min(int(round((center - centers[0]) / spacing)), self.board_size - 1) for center in centers]
+        return [grid_indices[group] for group in groups]
+
+    def assign_to_grid(self, records):
+        """ Clusters the records into rows and columns and picks the best matching text in each cell.  Returns the
+        board as a list of rows, with None for cells we could not read. """
+        # Only text that is close to a card word (or to one word of a two word card) is kept, whatever its
+        # confidence.  Every card also has its word printed upside down, and the reader turns that into confident
+        # garbage, which would otherwise pull the rows and columns apart, the same as the box art and the table.
+        matched_records = []
+        for record in records:
+            word, distance = self.match_word(record[1])
+            if word is not None:
+                matched_records.append((record, word, distance))
+        board = [[None] * self.board_size for _ in range(0, self.board_size)]
+        if not matched_records:
+            return board
+
+        x_centers = [(record[0][0] + record[0][1]) / 2 for record, _, _ in matched_records]
+        y_centers = [(record[0][2] + record[0][3]) / 2 for record, _, _ in matched_records]
+        # Cards are further apart than the words printed on them are long or tall, so the typical box size is a
+        # lower bound on the gap between two rows or two columns.
+        widths = sorted(record[0][1] - record[0][0] for record, _, _ in matched_records)
+        heights = sorted(record[0][3] - record[0][2] for record, _, _ in matched_records)
+        rows = self.cluster_positions(y_centers, heights[len(heights) // 2])
+        columns = self.cluster_positions(x_centers, widths[len(widths) // 2])
+
+        cells = {}
+        for index, matched_record in enumerate(matched_records):
+            cells.setdefault((rows[index], columns[index]), []).append((x_centers[index], matched_record))
+
+        for (row, column), pieces in cells.items():
+            # Each piece is a candidate on its own.  The pieces read together from left to right are one more
+            # candidate, for two word cards like ICE CREAM whose first word (ICE) is also a card.
+            candidates = [(distance, -len(word), -record[2], word) for _, (record, word, distance) in pieces]
+            if len(pieces) > 1:
+                pieces.sort(key=lambda piece: piece[0])
+                word, distance = self.match_word(" ".join(piece[1][0][1] for piece in pieces))
+                if word is not None:
+                    confidence = min(piece[1][0][2] for piece in pieces)
+                    candidates.append((distance, -len(word), -confidence, word))
+            board[row][column] = min(candidates)[3]
+        return board
+
+    def match_word(self, text):
+        """ Cleans up OCR text and returns (valid_word, distance) for the closest valid word, or (None, None). """
+        text = "".join(char for char in text.upper() if char.isalpha() or char == " ")
+        text = " ".join(text.split())
+        return self.word_index.closest(text, max(1, len(text) // 3))
+
+    # ------------------------------ Putting it together ------------------------------------
+
+    def read_board(self, img_path):
+        """ Reads one board photo and returns it as a list of rows of card words. """
+        return self.assign_to_grid(self.get_records(img_path))
+
+    def read_boards(self, img_paths, num_workers=4):
+        """ Reads many board photos.  Reading files, hashing, decoding and resizing happen in parallel, and the
+        reader lock keeps the model calls in order. """
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            return list(executor.map(self.read_board, img_paths))
+
+
+if __name__ == "__main__":
+    engine = OcrEngine("../codenames_ai/words.txt")
+    boards = engine.read_boards(['../codenames_ai/imgs/codenames_board_1.jpg', '../codenames_ai/imgs/codenames_board_2.jpg'])
+    for board in boards:
+        for row in board:
+            print(row)
\ No newline at end of file